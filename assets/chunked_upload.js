@@ -0,0 +1,73 @@
+// Streams the file picked with #chunked-upload-button to the /upload/chunk endpoint
+// in fixed-size slices, resuming from what the server already received, then
+// clicks #chunked-upload-done so the Dash file list refreshes.
+(function () {
+    var CHUNK_SIZE = 8 * 1024 * 1024;
+
+    function setProgress(text) {
+        var progress = document.getElementById("chunked-upload-progress");
+        if (progress) {
+            progress.textContent = text;
+        }
+    }
+
+    function uploadId(file) {
+        // Stable for the same file, so a retried upload resumes.
+        var key = file.name + "-" + file.size + "-" + file.lastModified;
+        return key.replace(/[^A-Za-z0-9_-]/g, "_").slice(-64);
+    }
+
+    function received(id) {
+        return fetch("/upload/chunk?upload_id=" + encodeURIComponent(id))
+            .then(function (response) { return response.json(); })
+            .then(function (body) { return body.received; });
+    }
+
+    function sendFrom(file, id, offset) {
+        if (offset >= file.size) {
+            var query = "?upload_id=" + encodeURIComponent(id) +
+                "&filename=" + encodeURIComponent(file.name);
+            return fetch("/upload/complete" + query, {method: "POST"});
+        }
+        setProgress(file.name + ": " + Math.floor(100 * offset / file.size) + "%");
+        var query = "?upload_id=" + encodeURIComponent(id) + "&offset=" + offset;
+        return fetch("/upload/chunk" + query, {
+            method: "POST",
+            headers: {"Content-Type": "application/octet-stream"},
+            body: file.slice(offset, offset + CHUNK_SIZE)
+        })
+            .then(function (response) { return response.json(); })
+            .then(function (body) { return sendFrom(file, id, body.received); });
+    }
+
+    function upload(file) {
+        var id = uploadId(file);
+        received(id)
+            .then(function (offset) { return sendFrom(file, id, offset); })
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                setProgress(file.name + ": done");
+                document.getElementById("chunked-upload-done").click();
+            })
+            .catch(function (error) {
+                setProgress(file.name + ": failed (" + error.message + "), pick it again to resume");
+            });
+    }
+
+    // Dash has no file input component, so the button opens one made here.
+    document.addEventListener("click", function (event) {
+        if (event.target.id !== "chunked-upload-button") {
+            return;
+        }
+        var input = document.createElement("input");
+        input.type = "file";
+        input.addEventListener("change", function () {
+            if (input.files.length) {
+                upload(input.files[0]);
+            }
+        });
+        input.click();
+    });
+})();
@@ -0,0 +1,355 @@
+# Benchmark the callback pipeline of wizard.py on synthetic data
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from plotly.utils import PlotlyJSONEncoder
+
+
+def parse_args():
+    """Read the size of the synthetic datasets and what to run from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the callback pipeline of wizard.py on synthetic data."
+    )
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int, default=12)
+    parser.add_argument(
+        "--cardinality",
+        type=int,
+        default=20,
+        help="distinct values of each category column",
+    )
+    parser.add_argument("--formats", default="csv,feather")
+    parser.add_argument(
+        "--chart-types", default=None, help="comma separated, default all of them"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        help="where uploads are stored, default a new temporary directory",
+    )
+    parser.add_argument("--output", default=None, help="JSON file, default stdout")
+    return parser.parse_args()
+
+
+def make_dataframe(rows, columns, cardinality, seed=0):
+    """Generate a Dataframe with a date, category columns and numeric columns.
+
+    A quarter of the columns are categories, the rest are numbers.
+    """
+    rng = np.random.default_rng(seed)
+    data = {
+        "date": pd.date_range("2020-01-01", periods=rows, freq="min").strftime(
+            "%Y-%m-%d %H:%M"
+        )
+    }
+    categories = max(1, (columns - 1) // 4)
+    for i in range(categories):
+        labels = np.array(["c{}_{}".format(i, j) for j in range(cardinality)])
+        data["category_{}".format(i)] = labels[rng.integers(0, cardinality, rows)]
+    for i in range(max(1, columns - 1 - categories)):
+        data["value_{}".format(i)] = rng.normal(100, 25, rows).round(3)
+    return pd.DataFrame(data)
+
+
+def encode_upload(dataframe, extension):
+    """Return a Dataframe as the base64 data URL dcc.Upload hands to save_file."""
+    buffer = io.BytesIO()
+    if extension == "csv":
+        dataframe.to_csv(buffer, index=False)
+    else:
+        # Feather files keep the types of their columns, dates included.
+        dataframe.assign(date=pd.to_datetime(dataframe["date"])).to_feather(buffer)
+    return "data:application/octet-stream;base64," + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def peak_rss_bytes():
+    """Return the peak resident set size of this process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def summarise(samples):
+    """Summarise the latencies of one stage in milliseconds."""
+    milliseconds = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "first": round(float(milliseconds[0]), 3),
+        "p50": round(float(np.percentile(milliseconds, 50)), 3),
+        "p90": round(float(np.percentile(milliseconds, 90)), 3),
+        "p99": round(float(np.percentile(milliseconds, 99)), 3),
+        "max": round(float(milliseconds.max()), 3),
+    }
+
+
+def measure(results, stage, function, *args, repeat=1):
+    """Time `repeat` calls of a function and record them under `stage`.
+
+    The first call usually misses the caches of wizard.py and the others
+    hit them. Returns the result of the last call.
+    """
+    samples = []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function(*args)
+            samples.append(time.perf_counter() - start)
+    except Exception as error:
+        results[stage] = {"error": "{}: {}".format(type(error).__name__, error)}
+        return None
+    results[stage] = summarise(samples)
+    results[stage]["peak_rss_bytes"] = peak_rss_bytes()
+    return result
+
+
+def serialise(outputs):
+    """Serialise callback outputs the way Dash does and return the byte count."""
+    return len(json.dumps(outputs, cls=PlotlyJSONEncoder))
+
+
+def filter_ids(columns):
+    """Return the ids of the `selected-filter` inputs of some columns."""
+    return [{"type": "selected-filter", "index": column} for column in columns]
+
+
+def benchmark_dataset(wizard, name, dataframe, extension, chart_types, repeat):
+    """Run every stage of the pipeline on one uploaded file."""
+    results = {}
+    content = encode_upload(dataframe, extension)
+    measure(results, "upload", wizard.save_file, name, content)
+    if "." + extension in wizard.CONVERSIONS:
+        measure(
+            results,
+            "convert",
+            lambda: wizard.conversion_executor.submit(
+                wizard.CONVERSIONS["." + extension][0], name
+            ).result(),
+        )
+    measure(results, "profile", wizard.load_profile, name)
+    measure(results, "cube", wizard.build_cube, name)
+
+    category = next(c for c in dataframe.columns if c.startswith("category_"))
+    x_axis = "value_0"
+    y_axis = next(
+        (c for c in dataframe.columns if c.startswith("value_") and c != x_axis),
+        x_axis,
+    )
+    no_filter = ([], [], [], [])
+    measure(
+        results,
+        "table_page",
+        lambda: serialise(
+            wizard.build_table(wizard.new_job("table"), name, 3, 10, *no_filter)
+        ),
+        repeat=repeat,
+    )
+
+    filter_widget = getattr(
+        wizard.Create_Dataframe, "__wrapped__", wizard.Create_Dataframe
+    )
+    for widget, column in [
+        ("Dropdown", category),
+        ("RangeSlider", x_axis),
+        ("DatePickerRange", "date"),
+    ]:
+        measure(
+            results,
+            "filter_widget_" + widget,
+            lambda: serialise(filter_widget(name, 1, widget, column)),
+            repeat=repeat,
+        )
+
+    # A RangeSlider dragged across the range of a column, one table per step.
+    low = float(dataframe[x_axis].min())
+    high = float(dataframe[x_axis].max())
+    steps = np.linspace(low, high, repeat + 2)[1:-1]
+    positions = iter(steps)
+    measure(
+        results,
+        "filter_loop",
+        lambda: serialise(
+            wizard.build_table(
+                wizard.new_job("table"),
+                name,
+                0,
+                10,
+                filter_ids([x_axis]),
+                [[int(low), int(next(positions))]],
+                [None],
+                [None],
+            )
+        ),
+        repeat=len(steps),
+    )
+
+    # A narrow DatePickerRange on the date column, which is sorted.
+    dates = pd.to_datetime(dataframe["date"])
+    date_range = (
+        filter_ids(["date"]),
+        [None],
+        [str(dates.iloc[len(dates) // 4].date())],
+        [str(dates.iloc[len(dates) // 4 + len(dates) // 20].date())],
+    )
+    measure(
+        results,
+        "filter_dates",
+        lambda: serialise(
+            wizard.build_table(wizard.new_job("table"), name, 0, 10, *date_range)
+        ),
+        repeat=repeat,
+    )
+    # The same range with cold caches, which skips the row groups whose
+    # statistics rule it out.
+    path = os.path.join(wizard.UPLOAD_DIRECTORY, name)
+    plan = wizard.compile_filters(*date_range)
+
+    def scan_dates():
+        wizard.invalidate_dataframe(path)
+        return len(wizard.scan_dataframe(name, ["date", x_axis], plan))
+
+    measure(results, "scan_dates_cold", scan_dates, repeat=repeat)
+    row_groups = wizard.matching_row_groups(name, wizard.file_version(path), plan)
+    if row_groups is not None and "error" not in results["scan_dates_cold"]:
+        results["scan_dates_cold"]["row_groups_read"] = "{} of {}".format(
+            int(row_groups[1].sum()), len(row_groups[1])
+        )
+
+    dropdown = (
+        filter_ids([category]),
+        [list(dataframe[category].unique()[:2])],
+        [None],
+        [None],
+    )
+    for function in ["sum", "mean"]:
+        measure(
+            results,
+            "group_by_" + function,
+            lambda: serialise(
+                wizard.build_figure(
+                    wizard.new_job("figure"),
+                    name,
+                    0,
+                    0,
+                    *dropdown,
+                    "bar",
+                    category,
+                    y_axis,
+                    [category],
+                    function,
+                    None,
+                    None,
+                    None,
+                    False,
+                    None,
+                    None,
+                    "html",
+                )
+            ),
+            repeat=repeat,
+        )
+
+    figure_results = {}
+    for chart_type in chart_types:
+        measure(
+            figure_results,
+            chart_type,
+            lambda: serialise(
+                wizard.build_figure(
+                    wizard.new_job("figure"),
+                    name,
+                    0,
+                    0,
+                    *no_filter,
+                    chart_type,
+                    x_axis,
+                    y_axis,
+                    [],
+                    None,
+                    None,
+                    None,
+                    None,
+                    False,
+                    None,
+                    None,
+                    "html",
+                )
+            ),
+            repeat=repeat,
+        )
+    results["figure"] = figure_results
+    return results
+
+
+def failed_stages(results):
+    """List the stages of a report that raised an error.
+
+    Figures are left out: some chart types, e.g. pie, take no x and y axes
+    and fail in wizard.py whatever the data.
+    """
+    return [
+        "{}: {}".format(stage, result["error"])
+        for stage, result in results.items()
+        if "error" in result
+    ]
+
+
+def main():
+    args = parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="wizard-benchmark-")
+    os.makedirs(workdir, exist_ok=True)
+    # wizard.py stores uploads relative to the working directory it is imported in.
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    # Repeated runs would otherwise time lookups in the persistent result
+    # cache rather than the stages themselves.
+    os.environ["RESULT_CACHE_BYTES"] = "0"
+    import wizard
+
+    chart_types = (
+        args.chart_types.split(",") if args.chart_types else wizard.chart_types
+    )
+    dataframe = make_dataframe(args.rows, args.columns, args.cardinality)
+    report = {
+        "rows": args.rows,
+        "columns": len(dataframe.columns),
+        "cardinality": args.cardinality,
+        "repeat": args.repeat,
+        "workdir": workdir,
+        "datasets": {},
+    }
+    for extension in args.formats.split(","):
+        name = "benchmark.{}".format(extension)
+        report["datasets"][name] = benchmark_dataset(
+            wizard, name, dataframe, extension, chart_types, args.repeat
+        )
+    report["peak_rss_bytes"] = peak_rss_bytes()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(output + "\n")
+    else:
+        print(output)
+    failed = [
+        "{}/{}".format(name, stage)
+        for name, results in report["datasets"].items()
+        for stage in failed_stages(results)
+    ]
+    if failed:
+        sys.exit("Failed stages:\n" + "\n".join(failed))
+
+
+if __name__ == "__main__":
+    main()
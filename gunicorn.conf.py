@@ -0,0 +1,20 @@
+# Serve wizard.py with several worker processes: gunicorn -c gunicorn.conf.py
+import multiprocessing
+import os
+
+wsgi_app = "wizard:server"
+bind = os.environ.get("BIND", "0.0.0.0:8050")
+workers = int(os.environ.get("WORKER_PROCESSES", multiprocessing.cpu_count()))
+# Polls wait up to JOB_WAIT_SECONDS for their job, so every worker serves
+# requests on several threads.
+worker_class = "gthread"
+threads = int(os.environ.get("WORKER_THREADS", 8))
+# Files uploaded through dcc.Upload are decoded within a single request.
+timeout = 300
+# Every worker starts its own thread pools and caches after the fork.
+preload_app = False
+
+
+def post_fork(server, worker):
+    """Tell wizard.py how many worker processes share the upload directory."""
+    os.environ["WORKER_PROCESSES"] = str(server.cfg.workers)
@@ -1,8 +1,32 @@
 # Import required libraries
 import base64
+import cProfile
+import glob
+import hashlib
+import inspect
+import io
+import json
 import os
+import pstats
+import re
+import sqlite3
+import warnings
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
 from urllib.parse import quote as urlquote
-from flask import Flask, send_from_directory
+from flask import (
+    Flask,
+    Response,
+    abort,
+    g,
+    has_request_context,
+    jsonify,
+    request,
+    send_from_directory,
+)
 
 import dash
 import pathlib
@@ -10,26 +34,198 @@ import dash_core_components as dcc
 import dash_html_components as html
 import plotly.express as px
 from dash.dependencies import Input, Output, State, MATCH, ALL
+from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
+from plotly.offline import get_plotlyjs_version
+from plotly.utils import PlotlyJSONEncoder
 import dash_table
 from datetime import datetime as dt
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+from pyarrow import compute as pc
+from pyarrow import feather
+from pyarrow import parquet as pq
 from datetime import datetime
 
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import kaleido
+except ImportError:
+    kaleido = None
+
 UPLOAD_DIRECTORY = "dataframes"
+PLOT_DIRECTORY = os.path.join("data", "plots")
+# Derived files (columnar copies, indexes, ...) live next to the uploads, one
+# sub directory per uploaded file, so uploaded_files() never lists them.
+ARTIFACT_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, ".artifacts")
+# Files streamed through the chunked upload endpoint are assembled here.
+PARTIAL_UPLOAD_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, ".uploads")
+# Larger files have to go through the chunked upload instead of dcc.Upload,
+# which holds several base64 copies of a file in memory.
+LARGE_UPLOAD_BYTES = 100 * 1024 ** 2
+SUPPORTED_EXTENSIONS = (".csv", ".feather", ".arrow")
+# Files in the Arrow IPC format, which are memory-mapped instead of parsed.
+ARROW_EXTENSIONS = (".feather", ".arrow")
+# Memory budget for parsed Dataframes shared by all callbacks of this process.
+DATAFRAME_CACHE_BYTES = int(os.environ.get("DATAFRAME_CACHE_BYTES", 1024 ** 3))
+# Uploads larger than this are filtered and aggregated out of core by DuckDB,
+# when it is installed, instead of being loaded into pandas.
+OUT_OF_CORE_BYTES = int(os.environ.get("OUT_OF_CORE_BYTES", DATAFRAME_CACHE_BYTES))
+# Backends picked per upload, e.g. "sales.csv=duckdb,small.csv=pandas".
+dataset_backends = dict(
+    item.split("=", 1)
+    for item in os.environ.get("DATASET_BACKENDS", "").split(",")
+    if "=" in item
+)
+# Memory DuckDB may use before spilling to disk, e.g. "4GB", default 80% of RAM.
+DUCKDB_MEMORY_LIMIT = os.environ.get("DUCKDB_MEMORY_LIMIT")
+
+# Worker processes serving the app, set by gunicorn.conf.py. With more than
+# one, they coordinate uploads, conversions and jobs through WORKER_DIRECTORY.
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", 1))
+WORKER_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, ".workers")
+# Jobs publish their progress and results here for polls served by other workers.
+JOB_DIRECTORY = os.path.join(WORKER_DIRECTORY, "jobs")
+JOB_FILE_SECONDS = 3600
+# save_file appends replaced uploads here, so every worker drops its copies.
+INVALIDATION_LOG = os.path.join(WORKER_DIRECTORY, "invalidations.log")
+# Work claimed by a worker that has not finished it in this long, e.g.
+# because it died, is claimed again.
+CLAIM_SECONDS = 3600
+# Full reads of uploads are stored as uncompressed Arrow files, which every
+# worker memory-maps instead of parsing its own copy.
+SHARED_DATASETS = (
+    os.environ.get("SHARED_DATASETS", "1" if WORKER_PROCESSES > 1 else "0") == "1"
+)
 
 if not os.path.exists(UPLOAD_DIRECTORY):
     os.makedirs(UPLOAD_DIRECTORY)
 
 
 server = Flask(__name__)
+# Gzip callback responses, e.g. figures, which needs flask-compress installed.
+GZIP_RESPONSES = os.environ.get("GZIP_RESPONSES", "0") == "1"
 app = dash.Dash(
-    server=server, meta_tags=[{"name": "viewport", "content": "width=device-width"}]
+    server=server,
+    meta_tags=[{"name": "viewport", "content": "width=device-width"}],
+    compress=GZIP_RESPONSES,
 )
 
 selected_dataframe = pd.DataFrame()
+conversion_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("CONVERSION_WORKERS", 2))
+)
+conversion_jobs = {}
+# Figures and tables are computed here, off the threads serving requests.
+job_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("JOB_WORKERS", 4)))
+jobs = OrderedDict()
+jobs_lock = threading.Lock()
+# The latest job of every (session, kind), which supersedes the earlier ones.
+session_jobs = {}
+JOB_HISTORY = 256
+# Saved plots are written here, one at a time, while the app keeps serving.
+export_executor = ThreadPoolExecutor(max_workers=1)
+export_jobs = {}
+# How long a poll waits for its job before the browser polls again, so quick
+# jobs come back in a single round trip.
+JOB_WAIT_SECONDS = 0.5
+# Jobs wait this long before starting, so while e.g. a RangeSlider is dragged
+# only the job of its last position runs.
+JOB_DEBOUNCE_SECONDS = float(os.environ.get("JOB_DEBOUNCE_SECONDS", 0.25))
+# Time the stages of every callback for /metrics and Server-Timing headers.
+INSTRUMENT = os.environ.get("INSTRUMENT", "0") == "1"
+# Keep the cProfile statistics of this many of the slowest jobs and callbacks.
+PROFILE_SLOWEST = int(os.environ.get("PROFILE_SLOWEST", 0))
+# (callback, stage): [calls, seconds, rows in, rows out, memory delta, bytes]
+stage_metrics = {}
+metrics_lock = threading.Lock()
+# Only one cProfile profiler can be active at a time.
+profiler_lock = threading.Lock()
+slowest_profiles = []
+# How far this worker has applied the invalidation log; earlier entries
+# predate its caches.
+invalidation_offset = (
+    os.path.getsize(INVALIDATION_LOG) if os.path.exists(INVALIDATION_LOG) else 0
+)
+invalidation_lock = threading.Lock()
+last_job_sweep = 0.0
+# Serialised outputs of the table and figure jobs, kept across restarts and
+# shared by every worker process. 0 turns the cache off.
+RESULT_CACHE_PATH = os.path.join(UPLOAD_DIRECTORY, ".results", "results.sqlite")
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", 512 * 1024 ** 2))
+# Request counts are kept for this many views, the most requested ones.
+RESULT_CACHE_VIEWS = 10000
+# Bump when a change alters the outputs of build_table or build_figure.
+RESULT_FORMAT = 3
+# Recompute the results of this many of the most requested views at startup.
+WARM_RESULTS = int(os.environ.get("WARM_RESULTS", 0))
+result_connections = threading.local()
+arrow_tables = OrderedDict()
+ARROW_TABLE_CACHE_SIZE = 32
+row_indexes = OrderedDict()
+# Small row groups let a page be served by decoding a single one of them.
+PARQUET_ROW_GROUP_SIZE = 64 * 1024
+# Every ROW_INDEX_STRIDE-th row of a CSV file has its byte offset indexed.
+ROW_INDEX_STRIDE = 1024
+filter_masks = OrderedDict()
+filter_masks_bytes = 0
+FILTER_MASK_CACHE_BYTES = 256 * 1024 ** 2
+row_group_bounds = OrderedDict()
+# Filtered scans that would read more than this share of the row groups of a
+# file load and cache the whole columns instead.
+SCAN_MAX_ROW_GROUPS_RATIO = 0.5
+profiles = OrderedDict()
+profile_loading = {}
+# Columns longer than this get their cardinality estimated with HyperLogLog.
+PROFILE_EXACT_ROWS = 1000000
+# Most distinct values of a column kept in its profile, e.g. for Dropdowns.
+PROFILE_VALUES_LIMIT = 10000
+PROFILE_TOP_K = 10
+HYPERLOGLOG_PRECISION = 14
+group_by_candidates = OrderedDict()
+# Views up to this many rows get their cardinality counted exactly.
+CARDINALITY_EXACT_ROWS = 64 * 1024
+aggregates = OrderedDict()
+aggregates_bytes = 0
+AGGREGATE_CACHE_BYTES = 256 * 1024 ** 2
+# How results of each group by function combine into a coarser grouping.
+ROLLUP_FUNCTIONS = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+cubes = OrderedDict()
+# Whether uploads get a cube of partial aggregates over their low-cardinality
+# columns, and the limits on the cardinality and the size of that cube.
+BUILD_CUBES = os.environ.get("BUILD_CUBES", "1") == "1"
+CUBE_MAX_CARDINALITY = 1000
+CUBE_MAX_CELLS = 1000000
+CUBE_FUNCTIONS = ("sum", "count", "min", "max")
+# Text columns with fewer distinct values per row than this become categoricals.
+CATEGORY_MAX_RATIO = 0.5
+# Line and scatter plots with more rows than this are downsampled.
+DOWNSAMPLE_THRESHOLD = 50000
+# Points kept per line, about two per horizontal pixel of the main graph.
+DOWNSAMPLE_POINTS = 2000
+# Cells of the grid that keeps one point per cell of a scatter plot.
+SCATTER_GRID = (300, 200)
+# Charts that can be rasterised into a grid of counts, and that grid's size.
+RASTER_CHART_TYPES = ("scatter", "density_heatmap", "density_contour")
+RASTER_SHAPE = (400, 300)
+# Whether figures carry their numeric arrays as base64 typed arrays, which
+# plotly.js decodes from version 2.28: "1", "0" or "auto" to check the
+# plotly.js of dcc.Graph. Plotly 6 and later emits typed arrays itself, so
+# they are decoded back to lists when turned off.
+BINARY_FIGURES = os.environ.get("BINARY_FIGURES", "auto")
+# plotly.js names of the typed arrays it decodes.
+BINARY_DTYPES = ("i1", "u1", "i2", "u2", "i4", "u4", "f4", "f8")
+dataframe_cache = OrderedDict()
+dataframe_cache_lock = threading.Lock()
+duckdb_connection = None
+dataframe_cache_loading = {}
+dataframe_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
 chart_types = [
     "area",
     "bar",
@@ -53,6 +249,10 @@ chart_types = [
 app.layout = html.Div(
     [
         dcc.Store(id="memory-dataframe", storage_type="session"),
+        dcc.Store(id="session-id", storage_type="session"),
+        dcc.Store(id="table-job"),
+        dcc.Store(id="figure-job"),
+        dcc.Store(id="export-path"),
         dcc.Tabs(
             id="tabs-example",
             children=[
@@ -65,6 +265,7 @@ app.layout = html.Div(
                                         html.H2("Upload"),
                                         dcc.Upload(
                                             id="upload-data",
+                                            max_size=LARGE_UPLOAD_BYTES,
                                             children=html.Div(
                                                 [
                                                     "Drag and drop or click to select a file to upload."
@@ -82,6 +283,21 @@ app.layout = html.Div(
                                             },
                                             multiple=True,
                                         ),
+                                        html.P(
+                                            "Large files (streamed in chunks):",
+                                            className="control_label",
+                                        ),
+                                        # Handled by assets/chunked_upload.js.
+                                        html.Button(
+                                            "Select a large file",
+                                            id="chunked-upload-button",
+                                        ),
+                                        html.Span(id="chunked-upload-progress"),
+                                        html.Button(
+                                            id="chunked-upload-done",
+                                            n_clicks=0,
+                                            style={"display": "none"},
+                                        ),
                                     ],
                                 )
                             ]
@@ -105,6 +321,19 @@ app.layout = html.Div(
                         ),
                         html.Div(
                             [
+                                html.Div(
+                                    [
+                                        html.P(
+                                            id="conversion-status",
+                                            className="control_label",
+                                        ),
+                                        dcc.Interval(
+                                            id="conversion-interval",
+                                            interval=1000,
+                                            disabled=True,
+                                        ),
+                                    ],
+                                ),
                                 html.Div(
                                     [
                                         html.H3(
@@ -177,6 +406,15 @@ app.layout = html.Div(
                                             page_size=10,
                                             page_action="custom",
                                         ),
+                                        html.P(
+                                            id="table-progress",
+                                            className="control_label",
+                                        ),
+                                        dcc.Interval(
+                                            id="table-job-interval",
+                                            interval=500,
+                                            disabled=True,
+                                        ),
                                     ],
                                     className="pretty_container eight columns",
                                 ),
@@ -199,6 +437,17 @@ app.layout = html.Div(
                                             ],
                                             className="dcc_control",
                                         ),
+                                        dcc.Checklist(
+                                            id="rasterise",
+                                            options=[
+                                                {
+                                                    "label": "Rasterise dense charts",
+                                                    "value": "rasterise",
+                                                }
+                                            ],
+                                            value=[],
+                                            className="dcc_control",
+                                        ),
                                     ],
                                     className="pretty_container two columns",
                                 ),
@@ -280,7 +529,18 @@ app.layout = html.Div(
                         html.Div(
                             [
                                 html.Div(
-                                    [dcc.Graph(id="main_graph", figure="",)],
+                                    [
+                                        html.P(
+                                            id="figure-progress",
+                                            className="control_label",
+                                        ),
+                                        dcc.Interval(
+                                            id="figure-job-interval",
+                                            interval=500,
+                                            disabled=True,
+                                        ),
+                                        dcc.Graph(id="main_graph", figure="",),
+                                    ],
                                     className="pretty_container twelve columns",
                                     style={"height": "700"},
                                 ),
@@ -291,9 +551,24 @@ app.layout = html.Div(
                             [
                                 html.Div(
                                     [
+                                        dcc.RadioItems(
+                                            id="save_format",
+                                            # PNG export needs kaleido.
+                                            options=[
+                                                {"label": "HTML", "value": "html"},
+                                                {"label": "JSON", "value": "json"},
+                                            ]
+                                            + (
+                                                [{"label": "PNG", "value": "png"}]
+                                                if kaleido is not None
+                                                else []
+                                            ),
+                                            value="html",
+                                            labelStyle={"display": "inline-block"},
+                                        ),
                                         html.Button(
                                             "Save plot", id="save_button", n_clicks=0
-                                        )
+                                        ),
                                     ],
                                     id="save_button_container",
                                     style={"display": "none"},
@@ -302,6 +577,9 @@ app.layout = html.Div(
                                     id="alert_save_plot",
                                     style={"color": "green", "font-weight": "bold"},
                                 ),
+                                dcc.Interval(
+                                    id="export-interval", interval=1000, disabled=True
+                                ),
                                 html.Div(id="n_clicks_save", style={"display": "none"}),
                             ],
                             className="row flex-display",
@@ -324,331 +602,3125 @@ def download(path):
     return send_from_directory(UPLOAD_DIRECTORY, path, as_attachment=True)
 
 
+@server.route("/stats/cache")
+def cache_stats():
+    """Report the counters of the Dataframe cache and of the result cache."""
+    info = dataframe_cache_info()
+    info["results"] = result_cache_info()
+    return jsonify(info)
+
+
+@server.route("/metrics")
+def metrics():
+    """Export the stage metrics of the callbacks in the Prometheus text format."""
+    # The resident memory shrinks too, so its net change is a gauge.
+    names = [
+        ("calls_total", "counter", "Stages run."),
+        ("seconds_total", "counter", "Wall time spent in the stage."),
+        ("rows_in_total", "counter", "Rows the stage started from."),
+        ("rows_out_total", "counter", "Rows the stage produced."),
+        ("memory_bytes", "gauge", "Net change of the resident memory in the stage."),
+        ("response_bytes_total", "counter", "Bytes of serialised callback responses."),
+    ]
+    with metrics_lock:
+        items = sorted(stage_metrics.items())
+    lines = []
+    for index, (name, kind, description) in enumerate(names):
+        metric = "wizard_stage_{}".format(name)
+        lines.append("# HELP {} {}".format(metric, description))
+        lines.append("# TYPE {} {}".format(metric, kind))
+        for (callback, stage), values in items:
+            lines.append(
+                '{}{{callback="{}",stage="{}"}} {}'.format(
+                    metric, metric_label(callback), metric_label(stage), values[index]
+                )
+            )
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+@server.route("/stats/profiles")
+def profile_stats():
+    """Show the cProfile statistics of the slowest jobs and callbacks."""
+    with metrics_lock:
+        profiles = sorted(slowest_profiles, reverse=True)
+    return Response(
+        "\n".join(
+            "{} took {:.3f}s\n{}".format(label, seconds, text)
+            for seconds, label, text in profiles
+        ),
+        mimetype="text/plain",
+    )
+
+
+@server.before_request
+def start_timing():
+    """Start timing a callback request, and profiling it if asked to."""
+    if not request.path.endswith("_dash-update-component"):
+        return
+    g.request_start = time.perf_counter()
+    g.stage_timings = []
+    g.profiler = start_profiler()
+
+
+@server.after_request
+def finish_timing(response):
+    """Record the time and response size of a callback request.
+
+    The stages of a job whose outputs the request returns are added to its
+    Server-Timing header.
+    """
+    if "request_start" not in g:
+        return response
+    seconds = time.perf_counter() - g.request_start
+    output = (request.get_json(silent=True) or {}).get("output", request.path)
+    # Label multi-output callbacks by their first output.
+    output = output.strip(".").split("...")[0]
+    stop_profiler(g.profiler, output, seconds)
+    if INSTRUMENT:
+        record_metric(
+            output, "callback", seconds, response_bytes=len(response.get_data())
+        )
+        timings = ["callback;dur={:.1f}".format(seconds * 1000)]
+        for index, (stage, stage_seconds) in enumerate(g.stage_timings):
+            timings.append(
+                'stage{};dur={:.1f};desc="{}"'.format(
+                    index, stage_seconds * 1000, stage.replace('"', "")
+                )
+            )
+        response.headers["Server-Timing"] = ", ".join(timings)
+    return response
+
+
+@server.before_request
+def apply_invalidations():
+    """Drop the cached copies of uploads that other worker processes replaced."""
+    global invalidation_offset
+    if WORKER_PROCESSES <= 1:
+        return
+    try:
+        size = os.path.getsize(INVALIDATION_LOG)
+    except OSError:
+        return
+    with invalidation_lock:
+        if size == invalidation_offset:
+            return
+        with open(INVALIDATION_LOG, "rb") as fp:
+            fp.seek(invalidation_offset if size > invalidation_offset else 0)
+            lines = fp.readlines()
+            invalidation_offset = fp.tell()
+    for line in lines:
+        pid, name = line.decode().rstrip("\n").split("\t", 1)
+        if int(pid) != os.getpid():
+            name = json.loads(name)
+            invalidate_dataframe(os.path.join(UPLOAD_DIRECTORY, name))
+            conversion_jobs.pop(name, None)
+
+
+def valid_upload_name(name):
+    """Tell whether a file name can be stored in the upload directory as it is."""
+    return bool(name) and name == os.path.basename(name) and not name.startswith(".")
+
+
+def upload_id_path(upload_id):
+    """Return where the chunks of a chunked upload are assembled."""
+    if not re.match(r"^[A-Za-z0-9_-]{1,64}$", upload_id or ""):
+        abort(400, "Invalid upload id.")
+    return os.path.join(PARTIAL_UPLOAD_DIRECTORY, upload_id + ".part")
+
+
+@server.route("/upload/chunk", methods=["GET", "POST"])
+def upload_chunk():
+    """Append a chunk to a chunked upload, or report how much has been received.
+
+    The request body is streamed to disk, so memory use is bounded whatever
+    the size of the file. A chunk has to start where the received bytes
+    end, which lets a client resume an interrupted upload after asking.
+    """
+    path = upload_id_path(request.args.get("upload_id"))
+    received = os.path.getsize(path) if os.path.exists(path) else 0
+    if request.method == "POST":
+        offset = request.args.get("offset", "")
+        if not offset.isdigit():
+            abort(400, "Invalid offset.")
+        if int(offset) != received:
+            return jsonify({"received": received}), 409
+        os.makedirs(PARTIAL_UPLOAD_DIRECTORY, exist_ok=True)
+        with open(path, "ab") as fp:
+            while True:
+                chunk = request.stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                fp.write(chunk)
+        received = os.path.getsize(path)
+    return jsonify({"received": received})
+
+
+@server.route("/upload/complete", methods=["POST"])
+def upload_complete():
+    """Move a finished chunked upload into the upload directory."""
+    path = upload_id_path(request.args.get("upload_id"))
+    name = os.path.basename(request.args.get("filename", ""))
+    if not valid_upload_name(name) or not os.path.exists(path):
+        abort(400, "Unknown upload or invalid file name.")
+    destination = os.path.join(UPLOAD_DIRECTORY, name)
+    os.replace(path, destination)
+    invalidate_dataframe(destination)
+    publish_invalidation(name)
+    remove_stale_artifacts(name)
+    process_upload(name)
+    return jsonify({"filename": name})
+
+
 def save_file(name, content):
-    """Decode and store a file uploaded with Plotly Dash."""
-    data = content.encode("utf8").split(b";base64,")[1]
-    with open(os.path.join(UPLOAD_DIRECTORY, name), "wb") as fp:
-        fp.write(base64.decodebytes(data))
+    """Decode and store a file uploaded with Plotly Dash.
 
+    The base64 payload is decoded slice by slice straight into the file,
+    instead of holding encoded and decoded copies of the whole file. Names
+    that are not plain file names are refused, as they could reach the
+    artifacts and job files kept under the upload directory.
+    """
+    if not valid_upload_name(name):
+        abort(400, "Invalid file name.")
+    start = content.index(";base64,") + len(";base64,")
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    # Replace the file instead of truncating it: memory-mapped readers of the
+    # old version keep a valid mapping until they let go of it.
+    with open(path + ".part", "wb") as fp:
+        # A multiple of 4 characters always decodes to whole bytes.
+        step = 4 * 1024 * 1024
+        for offset in range(start, len(content), step):
+            fp.write(base64.b64decode(content[offset : offset + step]))
+    os.replace(path + ".part", path)
+    invalidate_dataframe(path)
+    publish_invalidation(name)
+    remove_stale_artifacts(name)
 
-def file_download_link(filename):
-    """Create a Plotly Dash 'A' element that downloads a file from the app."""
-    location = "/download/{}".format(urlquote(filename))
-    return html.A(filename, href=location)
 
+def publish_invalidation(name):
+    """Tell the other worker processes to drop their cached copies of an upload."""
+    if WORKER_PROCESSES <= 1:
+        return
+    os.makedirs(WORKER_DIRECTORY, exist_ok=True)
+    # Appends of a single short line are atomic, whichever worker writes them.
+    with open(INVALIDATION_LOG, "a") as fp:
+        fp.write("{}\t{}\n".format(os.getpid(), json.dumps(name)))
 
-def uploaded_files():
-    """List the files in the upload directory."""
-    files = []
-    for filename in os.listdir(UPLOAD_DIRECTORY):
-        path = os.path.join(UPLOAD_DIRECTORY, filename)
-        if os.path.isfile(path):
-            files.append(filename)
-    return files
 
+def process_upload(name):
+    """Queue the background jobs that prepare a newly uploaded file."""
+    start_conversion(name)
+    conversion_executor.submit(load_profile, name)
+    conversion_executor.submit(build_cube, name)
 
-# Callbacks
-@app.callback(
-    Output("file-list", "options"),
-    [Input("upload-data", "filename"), Input("upload-data", "contents")],
-)
-def update_output(uploaded_filenames, uploaded_file_contents):
-    """Save uploaded files and regenerate the file list."""
 
-    if uploaded_filenames is not None and uploaded_file_contents is not None:
-        for name, data in zip(uploaded_filenames, uploaded_file_contents):
-            save_file(name, data)
+def file_version(path):
+    """Return the (mtime, size) pair identifying the current version of a file."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
 
-    files = uploaded_files()
-    if len(files) == 0:
-        return [html.Li("No files yet!")]
-    else:
-        return [{"label": filename, "value": filename} for filename in files]
 
+def artifact_path(name, version, suffix):
+    """Return where a file derived from one version of an upload is stored."""
+    return os.path.join(
+        ARTIFACT_DIRECTORY, name, "{:x}-{:x}.{}".format(version[0], version[1], suffix)
+    )
 
-@app.callback(
-    Output("memory-dataframe", "data"), [Input("file-list", "value")],
-)
-def return_selected_file(value):
-    return value
 
+def remove_stale_artifacts(name):
+    """Delete the derived files that belong to older versions of an upload."""
+    directory = os.path.join(ARTIFACT_DIRECTORY, name)
+    if not os.path.isdir(directory):
+        return
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    current = "{:x}-{:x}.".format(*file_version(path)) if os.path.exists(path) else None
+    for filename in os.listdir(directory):
+        if current is None or not filename.startswith(current):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
 
-@app.callback(
-    [Output("table", "columns"), Output("table", "data"), Output("div-table", "style")],
-    [
-        Input("memory-dataframe", "data"),
-        Input("table", "page_current"),
-        Input("table", "page_size"),
-    ],
-)
-def Create_Dataframe(value, page_current, page_size):
-    """Crate a Pandas Dataframe from chosen File."""
-    if value is None:
-        selected_dataframe = pd.DataFrame()
-        data = selected_dataframe.to_dict("records")
-        columns = [{"name": i, "id": i} for i in selected_dataframe.columns]
-        style = {"display": "none"}
-        return columns, data, style
 
-    path = os.path.join(UPLOAD_DIRECTORY, value)
-    extension = os.path.splitext(path)[1]
-    if extension == ".csv":
-        selected_dataframe = pd.read_csv(path)
-        data = selected_dataframe.iloc[
-            page_current * page_size : (page_current + 1) * page_size
-        ].to_dict("records")
-        columns = [{"name": i, "id": i} for i in selected_dataframe.columns]
-        style = {"display": "block"}
-    elif extension == ".feather":
-        selected_dataframe = pd.read_feather(path)
-        data = selected_dataframe.iloc[
-            page_current * page_size : (page_current + 1) * page_size
-        ].to_dict("records")
-        columns = [{"name": i, "id": i} for i in selected_dataframe.columns]
-        style = {"display": "block"}
+def convert_to_parquet(name):
+    """Write a typed Parquet copy of an uploaded CSV file and return its path.
+
+    The copy already has the compact dtypes of the file's schema. Files too
+    large to parse in pandas are streamed through DuckDB, with its types.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    version = file_version(path)
+    sidecar = artifact_path(name, version, "parquet")
+    os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+    if execution_backend(name) == "duckdb":
+        duckdb_convert_to_parquet(name, version, sidecar + ".tmp")
     else:
-        selected_dataframe = pd.DataFrame()
-        data = selected_dataframe.to_dict("records")
-        columns = [{"name": i, "id": i} for i in selected_dataframe.columns]
-        style = {"display": "none"}
+        compact_dataframe(name, version, pd.read_csv(path)).to_parquet(
+            sidecar + ".tmp", index=False, row_group_size=PARQUET_ROW_GROUP_SIZE
+        )
+    os.replace(sidecar + ".tmp", sidecar)
+    # The upload may have been replaced while we were converting it.
+    remove_stale_artifacts(name)
+    return sidecar
 
-    return columns, data, style
 
+def arrow_compressed(path):
+    """Tell whether the record batches of an Arrow file are compressed."""
+    # Only decompressed buffers are allocated, the others point into the map.
+    # The pool of its own leaves out what other jobs allocate meanwhile.
+    pool = pa.proxy_memory_pool(pa.default_memory_pool())
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source, memory_pool=pool)
+        if reader.num_record_batches == 0:
+            return False
+        # Every batch of a file is written with the same compression.
+        batch = reader.get_batch(0)
+        compressed = pool.bytes_allocated() > batch.nbytes / 2
+        # The pool has to outlive the buffers allocated from it.
+        del batch, reader
+    return compressed
 
-@app.callback(
-    [Output("customize_control", "children"), Output("filter_box", "children"),],
-    [Input("memory-dataframe", "data")],
-)
-def Create_Dataframe(dataframe):
-    options = [
-        {"label": "Dropdown", "value": "Dropdown"},
-        {"label": "RangeSlider", "value": "RangeSlider"},
-        {"label": "DatePickerRange", "value": "DatePickerRange"},
-    ]
-    if dataframe is None:
-        selected_dataframe = pd.DataFrame()
-        dropdowns = [x for x in selected_dataframe.columns]
-        filter_types = [x for x in selected_dataframe.columns]
-        return dropdowns, filter_types
-    path = os.path.join(UPLOAD_DIRECTORY, dataframe)
-    extension = os.path.splitext(path)[1]
-    if extension == ".csv":
-        selected_dataframe = pd.read_csv(path)
-    elif extension == ".feather":
-        selected_dataframe = pd.read_feather(path)
-    else:
-        selected_dataframe = pd.DataFrame()
 
-    dropdowns = [
-        html.Div(
-            [
-                html.Div(
-                    [
-                        html.P(
-                            id={"type": "dynamic-dropdown-name", "index": x},
-                            children=x,
-                            className="control_label six columns",
-                        ),
-                        dcc.Dropdown(
-                            id={"type": "dynamic-dropdown", "index": x},
-                            options=options,
-                            className="dcc_control six columns",
-                        ),
-                    ],
-                    className="pretty_container twelve columns",
-                )
-            ],
-            className="row flex-display six columns center",
-        )
-        for x in selected_dataframe.columns
-    ]
-    filter_types = [
-        html.Div(id={"type": "dynamic-filter", "index": x},)
-        for x in selected_dataframe.columns
-    ]
-    return dropdowns, filter_types
+def convert_to_arrow(name):
+    """Write an uncompressed copy of a compressed Feather/Arrow upload.
 
+    Compressed files have to be decoded into memory on every read, while an
+    uncompressed copy can be memory-mapped. Returns None if the upload can
+    already be mapped as it is. The schema of the file is inferred here too.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    version = file_version(path)
+    try:
+        compressed = arrow_compressed(path)
+    except pa.ArrowInvalid:
+        # Feather V1 files are not Arrow IPC files, so they get a copy too.
+        compressed = True
+    table = feather.read_table(path, memory_map=True)
+    if execution_backend(name) == "pandas":
+        load_schema(name, version, table.to_pandas())
+    if not compressed:
+        return None
+    copy = artifact_path(name, version, "arrow")
+    os.makedirs(os.path.dirname(copy), exist_ok=True)
+    feather.write_feather(table, copy + ".tmp", compression="uncompressed")
+    os.replace(copy + ".tmp", copy)
+    remove_stale_artifacts(name)
+    return copy
 
-@app.callback(
-    Output({"type": "dynamic-filter", "index": MATCH}, "children"),
-    [Input("memory-dataframe", "data"), Input("goto_main", "n_clicks")],
-    [
-        State({"type": "dynamic-dropdown", "index": MATCH}, "value"),
-        State({"type": "dynamic-dropdown-name", "index": MATCH}, "children"),
-    ],
-)
-def Create_Dataframe(dataframe, submit_coloumn, value, name):
-    if dataframe is None:
-        return ""
-    path = os.path.join(UPLOAD_DIRECTORY, dataframe)
-    extension = os.path.splitext(path)[1]
-    if extension == ".csv":
-        selected_dataframe = pd.read_csv(path)
-    elif extension == ".feather":
-        selected_dataframe = pd.read_feather(path)
-    selected_column = selected_dataframe[name]
 
-    if value == "Dropdown":
-        column_vlaues = selected_column.unique()#.tolist()
-        columns_values_dict = [{"label": v, "value": v} for v in column_vlaues]
-        return [
-            html.P(children=name, className="control_label",),
-            dcc.Dropdown(
-                id={"type": "selected-filter", "index": name},
-                className="dcc_control",
-                options=columns_values_dict,
-                multi=True,
-            ),
-            html.P(id={"type": "range_slider", "index": name},),
-        ]
-    if value == "RangeSlider":
-        selected_column_min = selected_column.min()
-        selected_column_max = selected_column.max()
+# extension: (job, artifact suffix, message while pending, message when ready)
+CONVERSIONS = {
+    ".csv": (
+        convert_to_parquet,
+        "parquet",
+        "Converting to Parquet...",
+        "Columnar copy ready.",
+    ),
+    ".feather": (
+        convert_to_arrow,
+        "arrow",
+        "Preparing memory-mapped Arrow file...",
+        "Memory-mapped Arrow file ready.",
+    ),
+}
+CONVERSIONS[".arrow"] = CONVERSIONS[".feather"]
 
-        return [
-            html.P(children=name, className="control_label",),
-            dcc.RangeSlider(
-                id={"type": "selected-filter", "index": name},
-                className="dcc_control",
-                min=selected_column_min,
-                max=selected_column_max,
-            ),
-            html.P(id={"type": "range_slider", "index": name},),
-        ]
-    if value == "DatePickerRange":
+
+def start_conversion(name):
+    """Queue the conversion of an uploaded file on the background pool.
+
+    With several worker processes, only the one that claims the conversion
+    runs it.
+    """
+    extension = os.path.splitext(name)[1]
+    if extension not in CONVERSIONS:
+        return
+    claim = None
+    if WORKER_PROCESSES > 1:
+        claim = claim_conversion(name, CONVERSIONS[extension][1])
+        if claim is None:
+            return
+    conversion_jobs[name] = conversion_executor.submit(run_conversion, name, claim)
+
+
+def conversion_claim_path(name, suffix):
+    """Return the file claiming the conversion of the current version of an upload."""
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    return artifact_path(name, file_version(path), suffix + ".claim")
+
+
+def claim_conversion(name, suffix):
+    """Claim the conversion of an upload for this worker process.
+
+    Returns the path of the claim, or None if another worker holds a claim
+    younger than CLAIM_SECONDS.
+    """
+    return claim_file(conversion_claim_path(name, suffix))
+
+
+def claim_file(claim):
+    """Create the file `claim` and return it, or None if another worker holds it."""
+    os.makedirs(os.path.dirname(claim), exist_ok=True)
+    try:
+        if time.time() - os.path.getmtime(claim) > CLAIM_SECONDS:
+            os.remove(claim)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return None
+    return claim
+
+
+def run_conversion(name, claim=None):
+    """Convert an uploaded file, releasing its claim once the copy is written.
+
+    A failed conversion leaves its error in the claim, so the other workers
+    report it instead of retrying.
+    """
+    try:
+        result = CONVERSIONS[os.path.splitext(name)[1]][0](name)
+    except Exception as error:
+        if claim is not None:
+            with open(claim, "w") as fp:
+                fp.write(str(error) or type(error).__name__)
+        raise
+    if claim is not None:
         try:
-            selected_column_date = pd.to_datetime(
-                selected_column, infer_datetime_format=True
-            )
-            year_min = min(selected_column_date).year
-            month_min = min(selected_column_date).month
-            day_min = min(selected_column_date).day
-            year_max = max(selected_column_date).year
-            month_max = max(selected_column_date).month
-            day_max = max(selected_column_date).day
-        except:
+            os.remove(claim)
+        except OSError:
             pass
-        return [
-            html.P(children=name, className="control_label",),
-            dcc.DatePickerRange(
-                id={"type": "selected-filter", "index": name},
-                min_date_allowed=dt(year_min, month_min, day_min),
-                max_date_allowed=dt(year_max, month_max, day_max),
-                className="dcc_control",
-            ),
-            html.P(id={"type": "range_slider", "index": name},),
-        ]
-    else:
-        return value
+    return result
 
 
-@app.callback(
-    [
-        Output("test_div", "children"),
-        Output("table_test", "columns"),
-        Output("table_test", "data"),
-        Output("select_x_axis", "options"),
-        Output("select_y_axis", "options"),
-        Output("group_by_columns", "options"),
-        Output("color_columns", "options"),
-        Output("facet_row", "options"),
-        Output("facet_col", "options"),
-    ],
-    [
-        Input("memory-dataframe", "data"),
-        Input("select_chart_type", "value"),
-        Input("table_test", "page_current"),
+def conversion_status(name):
+    """Describe the state of the converted copy of an uploaded file.
+
+    Returns a (message, pending) tuple. Files without a converted copy and
+    without a job, e.g. uploaded before the app started, are queued here.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    extension = os.path.splitext(name)[1]
+    if extension not in CONVERSIONS or not os.path.exists(path):
+        return "", False
+    _, suffix, pending_message, ready_message = CONVERSIONS[extension]
+    if os.path.exists(artifact_path(name, file_version(path), suffix)):
+        return ready_message, False
+    job = conversion_jobs.get(name)
+    if job is not None and not job.done():
+        return pending_message, True
+    if job is not None and job.exception() is not None:
+        return "Conversion failed, reading the original file: {}".format(
+            job.exception()
+        ), False
+    if job is not None and job.result() is None:
+        return ready_message, False
+    if job is None and WORKER_PROCESSES > 1:
+        # The conversion may be running, or have failed, in another worker.
+        try:
+            with open(conversion_claim_path(name, suffix)) as fp:
+                error = fp.read()
+        except OSError:
+            error = ""
+        if error:
+            return "Conversion failed, reading the original file: {}".format(
+                error
+            ), False
+    # No job yet, or its copy belonged to a version that has since been replaced.
+    start_conversion(name)
+    return pending_message, True
+
+
+def open_arrow_table(name, version):
+    """Memory-map an uploaded Feather/Arrow file as a pyarrow Table.
+
+    The Table only references the mapping, so slicing or selecting columns
+    reads just the pages it touches and every process reading the file
+    shares one copy of it in the page cache.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    copy = artifact_path(name, version, "arrow")
+    return memory_map_table(
+        (path,) + tuple(version), copy if os.path.exists(copy) else path
+    )
+
+
+def memory_map_table(key, path):
+    """Memory-map an Arrow file, keeping the mapping in arrow_tables under `key`."""
+    with dataframe_cache_lock:
+        if key in arrow_tables:
+            arrow_tables.move_to_end(key)
+            return arrow_tables[key]
+    table = feather.read_table(path, memory_map=True)
+    with dataframe_cache_lock:
+        arrow_tables[key] = table
+        while len(arrow_tables) > ARROW_TABLE_CACHE_SIZE:
+            arrow_tables.popitem(last=False)
+    return table
+
+
+def read_shared_dataframe(name, version, columns=None):
+    """Read an upload from its shared Arrow copy, or return None without one.
+
+    Numeric columns of the Dataframe point straight into the memory map, so
+    the worker processes reading a version share one copy of them in the
+    page cache.
+    """
+    shared = artifact_path(name, version, "shared.arrow")
+    if not os.path.exists(shared):
+        return None
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    table = memory_map_table((path,) + tuple(version) + ("shared",), shared)
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas(split_blocks=True)
+
+
+def share_dataframe(name, version, dataframe):
+    """Store a full read of an upload as its shared Arrow copy.
+
+    Returns the Dataframe read back from the copy, or `dataframe` itself if
+    Arrow cannot hold its columns.
+    """
+    try:
+        table = pa.Table.from_pandas(dataframe, preserve_index=False)
+    except (pa.ArrowException, TypeError, ValueError):
+        return dataframe
+    shared = artifact_path(name, version, "shared.arrow")
+    os.makedirs(os.path.dirname(shared), exist_ok=True)
+    # Workers reading the same version at once each write their own copy.
+    temporary = "{}.{}.tmp".format(shared, os.getpid())
+    feather.write_feather(table, temporary, compression="uncompressed")
+    os.replace(temporary, shared)
+    remove_stale_artifacts(name)
+    return read_shared_dataframe(name, version)
+
+
+def infer_schema(dataframe):
+    """Pick the most compact dtype that holds every column of a Dataframe.
+
+    Text columns of dates become datetime64 and other low-cardinality text
+    columns categoricals, integers are downcast to the smallest type holding
+    their range and floats to float32 when no value changes.
+    """
+    dtypes = {}
+    for column in dataframe.columns:
+        series = dataframe[column]
+        values = series.dropna()
+        if pd.api.types.is_bool_dtype(series.dtype) or not len(values):
+            continue
+        if pd.api.types.is_integer_dtype(series.dtype):
+            dtype = pd.to_numeric(
+                pd.Series([values.min(), values.max()]), downcast="integer"
+            ).dtype
+            if dtype.itemsize < series.dtype.itemsize:
+                dtypes[column] = str(dtype)
+        elif pd.api.types.is_float_dtype(series.dtype):
+            if series.dtype.itemsize > 4:
+                narrow = values.to_numpy().astype("float32")
+                if np.array_equal(narrow.astype(series.dtype), values.to_numpy()):
+                    dtypes[column] = "float32"
+        elif pd.api.types.is_object_dtype(series.dtype) or (
+            pd.api.types.is_string_dtype(series.dtype)
+        ):
+            if parse_dates(values) is not None:
+                dtypes[column] = "datetime64[ns]"
+            elif values.nunique() < CATEGORY_MAX_RATIO * len(series):
+                dtypes[column] = "category"
+    return dtypes
+
+
+def apply_schema(dataframe, dtypes):
+    """Convert the columns of a Dataframe to the dtypes of its stored schema."""
+    converted = {}
+    for column, dtype in dtypes.items():
+        if column not in dataframe.columns or str(dataframe[column].dtype) == dtype:
+            continue
+        try:
+            if dtype.startswith("datetime64"):
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    converted[column] = pd.to_datetime(
+                        dataframe[column], errors="coerce"
+                    )
+            else:
+                converted[column] = dataframe[column].astype(dtype)
+        except (TypeError, ValueError):
+            pass
+    if not converted:
+        return dataframe
+    return dataframe.assign(**converted)
+
+
+def load_schema(name, version, dataframe=None):
+    """Return the stored schema of an uploaded file.
+
+    Without a stored schema, one is inferred from `dataframe`, the full file
+    as parsed, and stored along with its memory use before and after the
+    conversion. Returns None if there is neither.
+    """
+    schema_path = artifact_path(name, version, "schema.json")
+    if os.path.exists(schema_path):
+        with open(schema_path) as fp:
+            return json.load(fp)
+    if dataframe is None:
+        return None
+    dtypes = infer_schema(dataframe)
+    schema = {
+        "dtypes": dtypes,
+        "memory_before": int(dataframe.memory_usage(deep=True).sum()),
+        "memory_after": int(
+            apply_schema(dataframe, dtypes).memory_usage(deep=True).sum()
+        ),
+    }
+    os.makedirs(os.path.dirname(schema_path), exist_ok=True)
+    with open(schema_path + ".tmp", "w") as fp:
+        json.dump(schema, fp)
+    os.replace(schema_path + ".tmp", schema_path)
+    return schema
+
+
+def compact_dataframe(name, version, dataframe, columns=None):
+    """Apply the schema of an upload to a Dataframe read from it.
+
+    The schema is inferred on the first full read of each file version.
+    Until then the `columns` of a projected read are compacted on their own,
+    which gives them the dtypes the full read will store.
+    """
+    schema = load_schema(name, version, dataframe if columns is None else None)
+    if schema is None:
+        return apply_schema(dataframe, infer_schema(dataframe))
+    return apply_schema(dataframe, schema["dtypes"])
+
+
+def read_dataframe(name, version, columns=None):
+    """Parse an uploaded file into a Pandas Dataframe based on its extension.
+
+    Only the `columns` given are read: CSV files skip parsing the others,
+    Parquet and Arrow files never decode them. CSV files are read from their
+    Parquet copy once the background conversion of that version has finished.
+    Arrow files are converted straight from their memory map. With
+    SHARED_DATASETS, full reads are stored as a shared Arrow copy that later
+    reads of every worker process map instead.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    extension = os.path.splitext(path)[1]
+    if columns is not None:
+        columns = list(columns)
+    if extension not in SUPPORTED_EXTENSIONS:
+        return pd.DataFrame()
+    if SHARED_DATASETS:
+        dataframe = read_shared_dataframe(name, version, columns)
+        if dataframe is not None:
+            return dataframe
+    if extension == ".csv":
+        sidecar = artifact_path(name, version, "parquet")
+        if os.path.exists(sidecar):
+            dataframe = pd.read_parquet(sidecar, columns=columns)
+        else:
+            dataframe = pd.read_csv(path, usecols=columns)
+            if columns is not None:
+                dataframe = dataframe[columns]
+            dataframe = compact_dataframe(name, version, dataframe, columns)
+    else:
+        table = open_arrow_table(name, version)
+        if columns is not None:
+            table = table.select(columns)
+        dataframe = compact_dataframe(name, version, table.to_pandas(), columns)
+    if SHARED_DATASETS and columns is None:
+        return share_dataframe(name, version, dataframe)
+    return dataframe
+
+
+def cached_dataframe(key):
+    """Look a read up in the Dataframe cache, also among reads of more columns.
+
+    The caller holds dataframe_cache_lock. Returns None on a miss.
+    """
+    if key in dataframe_cache:
+        dataframe_cache.move_to_end(key)
+        return dataframe_cache[key][0]
+    columns = key[3]
+    if columns is not None:
+        for cached_key, (cached, _) in dataframe_cache.items():
+            if cached_key[:3] == key[:3] and (
+                cached_key[3] is None or set(cached_key[3]) >= set(columns)
+            ):
+                dataframe_cache.move_to_end(cached_key)
+                return cached[list(columns)]
+    return None
+
+
+def load_dataframe(name, columns=None):
+    """Return the Dataframe of an uploaded file, parsing it only on a cache miss.
+
+    Entries are keyed on (path, mtime, size) so a file that changes on disk is
+    never served stale, and the least recently used entries are evicted once
+    the cache grows past DATAFRAME_CACHE_BYTES. Concurrent callbacks asking
+    for the same file wait for a single parse instead of starting their own.
+    Given the `columns` a callback needs, only those are read, unless a
+    cached read of the same version already holds them.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    if columns is not None:
+        columns = tuple(dict.fromkeys(columns))
+    key = (path,) + file_version(path) + (columns,)
+    while True:
+        with dataframe_cache_lock:
+            dataframe = cached_dataframe(key)
+            if dataframe is not None:
+                dataframe_cache_stats["hits"] += 1
+                return dataframe
+            loading = dataframe_cache_loading.get(key)
+            if loading is None:
+                dataframe_cache_stats["misses"] += 1
+                loading = dataframe_cache_loading[key] = threading.Event()
+                break
+        loading.wait()
+
+    try:
+        dataframe = read_dataframe(name, key[1:3], columns)
+        size = int(dataframe.memory_usage(deep=True).sum())
+        with dataframe_cache_lock:
+            if size <= DATAFRAME_CACHE_BYTES:
+                dataframe_cache[key] = (dataframe, size)
+                dataframe_cache_stats["bytes"] += size
+                while dataframe_cache_stats["bytes"] > DATAFRAME_CACHE_BYTES:
+                    _, (_, evicted_size) = dataframe_cache.popitem(last=False)
+                    dataframe_cache_stats["bytes"] -= evicted_size
+                    dataframe_cache_stats["evictions"] += 1
+    finally:
+        with dataframe_cache_lock:
+            del dataframe_cache_loading[key]
+        loading.set()
+    return dataframe
+
+
+def invalidate_dataframe(path):
+    """Drop every cached version of a file, e.g. after it has been overwritten."""
+    global filter_masks_bytes, aggregates_bytes
+    with dataframe_cache_lock:
+        for key in [key for key in dataframe_cache if key[0] == path]:
+            _, size = dataframe_cache.pop(key)
+            dataframe_cache_stats["bytes"] -= size
+        for key in [key for key in arrow_tables if key[0] == path]:
+            del arrow_tables[key]
+        for key in [key for key in row_indexes if key[0] == path]:
+            del row_indexes[key]
+        for key in [key for key in filter_masks if key[0] == path]:
+            filter_masks_bytes -= filter_masks.pop(key).nbytes
+        for key in [key for key in row_group_bounds if key[0] == path]:
+            del row_group_bounds[key]
+        for key in [key for key in profiles if key[0] == path]:
+            del profiles[key]
+        for key in [key for key in group_by_candidates if key[0] == path]:
+            del group_by_candidates[key]
+        for key in [key for key in cubes if key[0] == path]:
+            del cubes[key]
+        for key in [key for key in aggregates if key[0] == path]:
+            aggregates_bytes -= int(
+                aggregates.pop(key).memory_usage(deep=True).sum()
+            )
+
+
+def build_row_index(path):
+    """Return the byte offsets of every ROW_INDEX_STRIDE-th data row of a CSV file.
+
+    Newlines inside quoted fields do not end a row, so a newline only counts
+    when an even number of quotes precede it in the file.
+    """
+    offsets = []
+    rows = 0
+    quotes = 0
+    position = 0
+    with open(path, "rb") as fp:
+        while True:
+            chunk = fp.read(16 * 1024 * 1024)
+            if not chunk:
+                break
+            data = np.frombuffer(chunk, dtype=np.uint8)
+            newlines = np.flatnonzero(data == ord("\n"))
+            quote_positions = np.flatnonzero(data == ord('"'))
+            parity = (quotes + np.searchsorted(quote_positions, newlines)) % 2
+            # The first of these starts is the row following the header.
+            starts = newlines[parity == 0] + position + 1
+            first = (-rows) % ROW_INDEX_STRIDE
+            offsets.append(starts[first::ROW_INDEX_STRIDE])
+            rows += len(starts)
+            quotes += len(quote_positions)
+            position += len(chunk)
+    offsets = np.concatenate(offsets) if offsets else np.zeros(0, dtype=np.int64)
+    # A trailing newline does not start another row.
+    if len(offsets) and offsets[-1] >= position:
+        offsets = offsets[:-1]
+    return offsets.astype(np.int64)
+
+
+def load_row_index(name, version):
+    """Return the row offset index of an uploaded CSV file, building it once."""
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    key = (path,) + tuple(version)
+    with dataframe_cache_lock:
+        if key in row_indexes:
+            row_indexes.move_to_end(key)
+            return row_indexes[key]
+    index_path = artifact_path(name, version, "rowindex.npy")
+    if os.path.exists(index_path):
+        offsets = np.load(index_path)
+    else:
+        offsets = build_row_index(path)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(index_path + ".tmp", "wb") as fp:
+            np.save(fp, offsets)
+        os.replace(index_path + ".tmp", index_path)
+    with dataframe_cache_lock:
+        row_indexes[key] = offsets
+        while len(row_indexes) > ARROW_TABLE_CACHE_SIZE:
+            row_indexes.popitem(last=False)
+    return offsets
+
+
+def read_csv_page(name, version, start, length):
+    """Parse `length` rows of a CSV file starting at data row `start`."""
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    header = pd.read_csv(path, nrows=0).columns
+    offsets = load_row_index(name, version)
+    block = start // ROW_INDEX_STRIDE
+    if block >= len(offsets):
+        return pd.DataFrame(columns=header)
+    with open(path, "rb") as fp:
+        fp.seek(offsets[block])
+        try:
+            return pd.read_csv(
+                fp,
+                header=None,
+                names=header,
+                skiprows=start - block * ROW_INDEX_STRIDE,
+                nrows=length,
+            )
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame(columns=header)
+
+
+def read_parquet_page(path, start, length):
+    """Read `length` rows of a Parquet file, decoding only the row groups holding them."""
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    groups = []
+    first_row = None
+    row = 0
+    for group in range(metadata.num_row_groups):
+        rows = metadata.row_group(group).num_rows
+        if row + rows > start and row < start + length:
+            groups.append(group)
+            if first_row is None:
+                first_row = row
+        row += rows
+    if not groups:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    table = parquet_file.read_row_groups(groups)
+    return table.slice(start - first_row, length).to_pandas()
+
+
+def read_parquet_rows(path, positions):
+    """Read the rows at sorted `positions` of a Parquet file.
+
+    Only the row groups holding one of the rows are decoded.
+    """
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    sizes = [
+        metadata.row_group(group).num_rows for group in range(metadata.num_row_groups)
+    ]
+    starts = np.cumsum([0] + sizes)
+    row_groups = np.searchsorted(starts, positions, side="right") - 1
+    groups, group_of = np.unique(row_groups, return_inverse=True)
+    if not len(groups):
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    # Where each selected group starts once they are read back to back.
+    offsets = np.cumsum([0] + [sizes[group] for group in groups])[group_of]
+    table = parquet_file.read_row_groups(groups.tolist())
+    return table.take(positions - starts[row_groups] + offsets).to_pandas()
+
+
+def read_rows(name, positions):
+    """Return the rows at sorted `positions` of an uploaded file with all columns.
+
+    Arrow files take the rows from their memory map and CSV files from the
+    row groups of their Parquet copy, so a page of a filtered view does not
+    need every column of the file in memory.
+    """
+    extension = os.path.splitext(name)[1]
+    version = file_version(os.path.join(UPLOAD_DIRECTORY, name))
+    if extension in ARROW_EXTENSIONS:
+        return open_arrow_table(name, version).take(positions).to_pandas()
+    if extension == ".csv":
+        sidecar = artifact_path(name, version, "parquet")
+        if os.path.exists(sidecar):
+            return read_parquet_rows(sidecar, positions)
+    return load_dataframe(name).iloc[positions]
+
+
+def read_page(name, page_current, page_size):
+    """Return one page of rows of an uploaded file without loading all of it.
+
+    Arrow files are sliced straight out of their memory map, CSV files are
+    read from the row groups of their Parquet copy or, until that exists,
+    by seeking to the page through their row offset index.
+    """
+    start = page_current * page_size
+    extension = os.path.splitext(name)[1]
+    version = file_version(os.path.join(UPLOAD_DIRECTORY, name))
+    if extension in ARROW_EXTENSIONS:
+        return open_arrow_table(name, version).slice(start, page_size).to_pandas()
+    if extension == ".csv":
+        sidecar = artifact_path(name, version, "parquet")
+        if os.path.exists(sidecar):
+            return read_parquet_page(sidecar, start, page_size)
+        return read_csv_page(name, version, start, page_size)
+    return pd.DataFrame()
+
+
+def dataframe_cache_info():
+    """Return a snapshot of the Dataframe cache counters."""
+    with dataframe_cache_lock:
+        info = dict(dataframe_cache_stats)
+        info["entries"] = len(dataframe_cache)
+        info["budget"] = DATAFRAME_CACHE_BYTES
+    return info
+
+
+def plot_columns(*selections):
+    """Collect the distinct columns referenced by the controls of a plot.
+
+    Accepts column names, lists of them and `selected-filter` ids.
+    """
+    columns = []
+    for selection in selections:
+        if selection is None:
+            continue
+        if not isinstance(selection, list):
+            selection = [selection]
+        for item in selection:
+            if isinstance(item, dict):
+                item = item["index"]
+            if item not in columns:
+                columns.append(item)
+    return columns
+
+
+def compile_filters(column, value, start_date, end_date):
+    """Translate the state of the `selected-filter` inputs into a filter plan.
+
+    The plan is a tuple of (kind, column, argument) predicates that all have
+    to hold: ("isin", column, values) for Dropdowns, ("range", column,
+    (low, high)) for RangeSliders and DatePickerRanges, where a missing bound
+    is None, and ("eq", column, value) for single values.
+    """
+    plan = []
+    for x in range(len(column)):
+        name = column[x]["index"]
+        if (value[x] is None) and (start_date[x] is None or end_date[x] is None):
+            continue
+        if isinstance(value[x], list):
+            if len(value[x]) > 0:
+                if isinstance(value[x][0], int) and len(value[x]) == 2:
+                    plan.append(("range", name, (value[x][0], value[x][1])))
+                else:
+                    values = tuple(sorted(set(value[x]), key=repr))
+                    plan.append(("isin", name, values))
+            continue
+        if start_date[x] is not None or end_date[x] is not None:
+            plan.append(("range", name, (start_date[x], end_date[x])))
+            continue
+        if value[x] == "":
+            continue
+        plan.append(("eq", name, value[x]))
+    return tuple(plan)
+
+
+def predicate_mask(series, kind, argument):
+    """Evaluate one predicate of a filter plan into a boolean NumPy array."""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype) and kind != "range":
+        # Dropdowns of date columns hold their values as text.
+        if kind == "isin":
+            argument = tuple(pd.to_datetime(list(argument), errors="coerce"))
+        else:
+            argument = pd.to_datetime(argument, errors="coerce")
+    if kind == "isin":
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Look the category codes up in a table instead of hashing values.
+            positions = series.cat.categories.get_indexer(list(argument))
+            selected = np.zeros(len(series.cat.categories) + 1, dtype=bool)
+            selected[positions[positions >= 0]] = True
+            return selected[series.cat.codes.to_numpy()]
+        return series.isin(argument).to_numpy(dtype=bool)
+    if kind == "range":
+        low, high = argument
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            low = None if low is None else pd.Timestamp(low)
+            high = None if high is None else pd.Timestamp(high)
+        if series.is_monotonic_increasing:
+            # Sorted columns need two binary searches instead of a full scan.
+            # The searches go through pandas, which compares Timestamps with
+            # datetime64 columns where NumPy does not.
+            mask = np.zeros(len(series), dtype=bool)
+            start = 0 if low is None else series.searchsorted(low, "left")
+            stop = len(series) if high is None else series.searchsorted(high, "right")
+            mask[start:stop] = True
+            return mask
+        mask = np.ones(len(series), dtype=bool)
+        if low is not None:
+            mask &= (series >= low).to_numpy(dtype=bool, na_value=False)
+        if high is not None:
+            mask &= (series <= high).to_numpy(dtype=bool, na_value=False)
+        return mask
+    return (series == argument).to_numpy(dtype=bool, na_value=False)
+
+
+def cached_predicate_mask(name, version, dataframe, predicate):
+    """Return the mask of one predicate, evaluating it only on a cache miss.
+
+    Masks are kept per file version and predicate, so moving one slider only
+    evaluates that slider's column again, and the table and the graph
+    callback share the masks of the same filter state.
+    """
+    global filter_masks_bytes
+    key = (os.path.join(UPLOAD_DIRECTORY, name),) + tuple(version) + (predicate,)
+    with dataframe_cache_lock:
+        mask = filter_masks.get(key)
+        if mask is not None and len(mask) == len(dataframe):
+            filter_masks.move_to_end(key)
+            return mask
+    kind, column, argument = predicate
+    mask = predicate_mask(dataframe[column], kind, argument)
+    with dataframe_cache_lock:
+        if key not in filter_masks:
+            filter_masks[key] = mask
+            filter_masks_bytes += mask.nbytes
+        while filter_masks_bytes > FILTER_MASK_CACHE_BYTES:
+            _, evicted = filter_masks.popitem(last=False)
+            filter_masks_bytes -= evicted.nbytes
+    return mask
+
+
+def filter_mask(name, dataframe, plan):
+    """Combine the cached masks of the predicates of a filter plan."""
+    version = file_version(os.path.join(UPLOAD_DIRECTORY, name))
+    mask = np.ones(len(dataframe), dtype=bool)
+    for predicate in plan:
+        mask &= cached_predicate_mask(name, version, dataframe, predicate)
+    return mask
+
+
+def filter_dataframe(name, dataframe, plan):
+    """Return the rows of a Dataframe matching a filter plan, copied only once."""
+    if not plan:
+        return dataframe
+    return dataframe[filter_mask(name, dataframe, plan)]
+
+
+def load_row_group_bounds(name, version, column):
+    """Return the first row, minimum and maximum of every row group of a column.
+
+    The Parquet copy of a CSV file has them in its footer. Arrow files have
+    them computed once per record batch. The first rows end with the number
+    of rows of the file. Returns None when the file can't be scanned by row
+    group, e.g. a CSV file still being converted.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    key = (path,) + tuple(version) + (column,)
+    with dataframe_cache_lock:
+        if key in row_group_bounds:
+            row_group_bounds.move_to_end(key)
+            return row_group_bounds[key]
+    extension = os.path.splitext(name)[1]
+    starts = [0]
+    minimums = []
+    maximums = []
+    if extension == ".csv":
+        sidecar = artifact_path(name, version, "parquet")
+        if not os.path.exists(sidecar):
+            return None
+        metadata = pq.ParquetFile(sidecar).metadata
+        if column not in metadata.schema.names:
+            return None
+        index = metadata.schema.names.index(column)
+        for group in range(metadata.num_row_groups):
+            row_group = metadata.row_group(group)
+            statistics = row_group.column(index).statistics
+            if statistics is None or not statistics.has_min_max:
+                if statistics is None or statistics.null_count != row_group.num_rows:
+                    return None
+                minimums.append(None)
+                maximums.append(None)
+            else:
+                minimums.append(statistics.min)
+                maximums.append(statistics.max)
+            starts.append(starts[-1] + row_group.num_rows)
+    elif extension in ARROW_EXTENSIONS:
+        schema = load_schema(name, version)
+        if schema is not None and schema["dtypes"].get(column, "").startswith(
+            "datetime64"
+        ):
+            # Dates stored as text don't sort like the dates they are parsed to.
+            return None
+        table = open_arrow_table(name, version)
+        if column not in table.column_names:
+            return None
+        for batch in table.select([column]).to_batches():
+            bounds = pc.min_max(batch.column(0))
+            minimums.append(bounds["min"].as_py())
+            maximums.append(bounds["max"].as_py())
+            starts.append(starts[-1] + batch.num_rows)
+    else:
+        return None
+    bounds = (np.array(starts), minimums, maximums)
+    with dataframe_cache_lock:
+        row_group_bounds[key] = bounds
+        while len(row_group_bounds) > ARROW_TABLE_CACHE_SIZE * 16:
+            row_group_bounds.popitem(last=False)
+    return bounds
+
+
+def may_match(kind, argument, minimum, maximum):
+    """Tell whether a row group with these bounds can hold rows matching a predicate.
+
+    Row groups without values can't, and any bounds that don't compare with
+    the argument might.
+    """
+    if minimum is None:
+        return False
+    try:
+        if isinstance(minimum, datetime):
+            minimum = pd.Timestamp(minimum)
+            maximum = pd.Timestamp(maximum)
+            if kind == "isin":
+                argument = [pd.Timestamp(value) for value in argument]
+            elif kind == "range":
+                argument = [
+                    None if bound is None else pd.Timestamp(bound) for bound in argument
+                ]
+            else:
+                argument = pd.Timestamp(argument)
+        if kind == "isin":
+            return any(minimum <= value <= maximum for value in argument)
+        if kind == "range":
+            low, high = argument
+            return (low is None or maximum >= low) and (high is None or minimum <= high)
+        return bool(minimum <= argument <= maximum)
+    except (TypeError, ValueError):
+        return True
+
+
+def matching_row_groups(name, version, plan):
+    """Return the row groups of an upload that can hold rows matching a filter plan.
+
+    Returns the first rows of the groups as load_row_group_bounds does and a
+    boolean per group, or None when the file can't be scanned by row group.
+    """
+    starts = None
+    selected = None
+    for kind, column, argument in plan:
+        bounds = load_row_group_bounds(name, version, column)
+        if bounds is None:
+            continue
+        starts, minimums, maximums = bounds
+        candidates = np.array(
+            [
+                may_match(kind, argument, minimum, maximum)
+                for minimum, maximum in zip(minimums, maximums)
+            ],
+            dtype=bool,
+        )
+        selected = candidates if selected is None else selected & candidates
+    if selected is None:
+        return None
+    return starts, selected
+
+
+def read_row_groups(name, version, columns, starts, groups):
+    """Read the `columns` of some row groups of an upload.
+
+    The index of the result holds the positions of its rows in the file.
+    """
+    if not len(groups):
+        # An empty read still needs the dtypes of the columns.
+        return read_row_groups(name, version, columns, starts, np.array([0])).iloc[:0]
+    extension = os.path.splitext(name)[1]
+    if extension == ".csv":
+        sidecar = artifact_path(name, version, "parquet")
+        dataframe = (
+            pq.ParquetFile(sidecar)
+            .read_row_groups(groups.tolist(), columns=columns)
+            .to_pandas()
+        )
+    else:
+        table = open_arrow_table(name, version).select(columns)
+        table = pa.concat_tables(
+            [
+                table.slice(starts[group], starts[group + 1] - starts[group])
+                for group in groups
+            ]
+        )
+        dataframe = compact_dataframe(name, version, table.to_pandas(), columns)
+    dataframe.index = np.concatenate(
+        [np.arange(starts[group], starts[group + 1]) for group in groups]
+    )
+    return dataframe
+
+
+def scan_dataframe(name, columns, plan):
+    """Return the rows of the `columns` of an upload matching a filter plan.
+
+    The index of the result holds the positions of its rows in the file.
+    Unless the columns are cached already, row groups whose statistics rule
+    out one of the predicates are skipped before any of their data is read.
+    """
+    columns = plot_columns(list(columns))
+    if not plan:
+        return load_dataframe(name, columns=columns)
+    needed = plot_columns(columns, [predicate[1] for predicate in plan])
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    version = file_version(path)
+    with dataframe_cache_lock:
+        cached = cached_dataframe((path,) + version + (tuple(needed),))
+    if cached is None:
+        row_groups = matching_row_groups(name, version, plan)
+        if row_groups is not None and len(row_groups[1]):
+            starts, selected = row_groups
+            if selected.mean() <= SCAN_MAX_ROW_GROUPS_RATIO:
+                dataframe = read_row_groups(
+                    name, version, needed, starts, np.flatnonzero(selected)
+                )
+                mask = np.ones(len(dataframe), dtype=bool)
+                for kind, column, argument in plan:
+                    mask &= predicate_mask(dataframe[column], kind, argument)
+                return dataframe.loc[mask, columns]
+    dataframe = load_dataframe(name, columns=needed)
+    return filter_dataframe(name, dataframe, plan)[columns]
+
+
+def hyperloglog(series, precision=HYPERLOGLOG_PRECISION):
+    """Return the HyperLogLog registers of the distinct values of a Series.
+
+    Registers of different parts of a column can be merged with np.maximum.
+    """
+    # Hashing every value directly is much cheaper than factorizing them first.
+    hashes = pd.util.hash_pandas_object(series, index=False, categorize=False)
+    hashes = hashes.to_numpy()
+    buckets = (hashes >> np.uint64(64 - precision)).astype(np.intp)
+    rest = hashes << np.uint64(precision)
+    # Bit length of the remaining bits, computed on halves that floats hold exactly.
+    high = np.frexp((rest >> np.uint64(32)).astype(np.float64))[1]
+    low = np.frexp((rest & np.uint64(0xFFFFFFFF)).astype(np.float64))[1]
+    length = np.where(high > 0, high + 32, low)
+    rank = np.minimum(65 - length, 65 - precision).astype(np.uint8)
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    np.maximum.at(registers, buckets, rank)
+    return registers
+
+
+def hyperloglog_estimate(registers):
+    """Estimate the number of distinct values counted by HyperLogLog registers."""
+    size = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / size) * size * size
+    estimate /= np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * size and zeros:
+        estimate = size * np.log(size / zeros)
+    return int(round(estimate))
+
+
+def has_few_distinct(series, threshold):
+    """Tell whether a Series holds fewer than `threshold` distinct values.
+
+    Small Series are counted exactly, and so are Series whose random sample
+    shows very few values, which hash tables count faster than a sketch.
+    The rest are sketched with HyperLogLog chunk by chunk, stopping as soon
+    as the estimate is clearly above the threshold.
+    """
+    if len(series) <= CARDINALITY_EXACT_ROWS:
+        return series.nunique(dropna=False) < threshold
+    positions = np.random.default_rng(0).integers(
+        0, len(series), CARDINALITY_EXACT_ROWS
+    )
+    if series.iloc[positions].nunique(dropna=False) < CARDINALITY_EXACT_ROWS / 100:
+        return series.nunique(dropna=False) < threshold
+    # Three standard errors of the estimate.
+    margin = 1 + 3 * 1.04 / np.sqrt(1 << HYPERLOGLOG_PRECISION)
+    registers = np.zeros(1 << HYPERLOGLOG_PRECISION, dtype=np.uint8)
+    for start in range(0, len(series), CARDINALITY_EXACT_ROWS):
+        chunk = series.iloc[start : start + CARDINALITY_EXACT_ROWS]
+        np.maximum(registers, hyperloglog(chunk), out=registers)
+        if hyperloglog_estimate(registers) > threshold * margin:
+            return False
+    return hyperloglog_estimate(registers) < threshold
+
+
+def group_by_columns_of(name, rows, plan):
+    """Return the columns of a filtered view with few enough values to group by.
+
+    The view holds the `rows` of the file matching `plan`. A column
+    qualifies when it has fewer distinct values than half the rows of the
+    view. The profile settles most columns without touching them: a view
+    can't have more distinct values than its whole file, nor fewer than its
+    rows minus the duplicated rows of the file. Only the columns it leaves
+    open are loaded. Results are cached per filter plan.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    key = (path,) + file_version(path) + (plan,)
+    with dataframe_cache_lock:
+        if key in group_by_candidates:
+            group_by_candidates.move_to_end(key)
+            return group_by_candidates[key]
+    profile = load_profile(name)
+    threshold = rows / 2
+    qualifying = set()
+    undecided = []
+    for column, column_profile in profile["columns"].items():
+        if column_profile["distinct_exact"]:
+            distinct = column_profile["distinct"] + (column_profile["nulls"] > 0)
+            if distinct < threshold:
+                qualifying.add(column)
+                continue
+            if rows - (profile["rows"] - distinct) >= threshold:
+                continue
+        undecided.append(column)
+    if undecided:
+        qualifying.update(
+            EXECUTION_BACKENDS[execution_backend(name)]["few_distinct"](
+                name, plan, undecided, threshold
+            )
+        )
+    candidates = [column for column in profile["columns"] if column in qualifying]
+    with dataframe_cache_lock:
+        group_by_candidates[key] = candidates
+        while len(group_by_candidates) > ARROW_TABLE_CACHE_SIZE:
+            group_by_candidates.popitem(last=False)
+    return candidates
+
+
+def json_value(value):
+    """Convert a value read from a Dataframe into something JSON can store."""
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def profile_column(series):
+    """Summarise one column: dtype, nulls, cardinality, range, top values, dates."""
+    values = series.dropna()
+    profile = {
+        "dtype": str(series.dtype),
+        "nulls": int(len(series) - len(values)),
+        "distinct": None,
+        "distinct_exact": True,
+        "values": None,
+        "top": [],
+        "min": None,
+        "max": None,
+        "sorted": False,
+        "is_date": False,
+        "date_min": None,
+        "date_max": None,
+    }
+    counts = None
+    if len(values) > PROFILE_EXACT_ROWS:
+        profile["distinct"] = hyperloglog_estimate(hyperloglog(values))
+        profile["distinct_exact"] = False
+    if profile["distinct_exact"] or profile["distinct"] <= 2 * PROFILE_VALUES_LIMIT:
+        counts = values.value_counts()
+        counts = counts[counts > 0]
+        profile["distinct"] = len(counts)
+        profile["distinct_exact"] = True
+    else:
+        sample = values.sample(PROFILE_EXACT_ROWS, random_state=0)
+        counts = sample.value_counts()
+        counts = counts[counts > 0] * (len(values) / len(sample))
+    profile["top"] = [
+        [json_value(value), int(count)]
+        for value, count in counts.head(PROFILE_TOP_K).items()
+    ]
+    if profile["distinct_exact"] and profile["distinct"] <= PROFILE_VALUES_LIMIT:
+        distinct_values = values.unique()
+    else:
+        distinct_values = counts.index[:PROFILE_VALUES_LIMIT]
+    profile["values"] = [json_value(value) for value in distinct_values]
+
+    if (
+        pd.api.types.is_numeric_dtype(series.dtype)
+        or pd.api.types.is_datetime64_any_dtype(series.dtype)
+    ) and len(values):
+        profile["min"] = json_value(values.min())
+        profile["max"] = json_value(values.max())
+    try:
+        profile["sorted"] = bool(series.is_monotonic_increasing)
+    except TypeError:
+        pass
+
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        dates = values
+    else:
+        dates = parse_dates(values)
+    if dates is not None and len(dates):
+        profile["is_date"] = True
+        profile["date_min"] = json_value(dates.min())
+        profile["date_max"] = json_value(dates.max())
+    return profile
+
+
+def parse_dates(values):
+    """Parse a text Series without missing values as dates.
+
+    Returns None for other types, or when any of the values is not a date.
+    A sample is tried first so most text columns are rejected quickly.
+    """
+    if not len(values) or not (
+        pd.api.types.is_object_dtype(values.dtype)
+        or pd.api.types.is_string_dtype(values.dtype)
+    ):
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if not pd.to_datetime(values.head(1000), errors="coerce").notna().all():
+            return None
+        dates = pd.to_datetime(values, errors="coerce")
+    return None if dates.isna().any() else dates
+
+
+def profile_dataframe(dataframe):
+    """Build the profile of every column of a Dataframe."""
+    return {
+        "rows": len(dataframe),
+        "columns": {
+            column: profile_column(dataframe[column]) for column in dataframe.columns
+        },
+    }
+
+
+def load_profile(name):
+    """Return the column profile of an uploaded file, computing it once per version.
+
+    Profiles are stored next to the upload, so they survive restarts and are
+    shared by every callback instead of rescanning the data.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    version = file_version(path)
+    key = (path,) + version
+    while True:
+        with dataframe_cache_lock:
+            if key in profiles:
+                profiles.move_to_end(key)
+                return profiles[key]
+            loading = profile_loading.get(key)
+            if loading is None:
+                loading = profile_loading[key] = threading.Event()
+                break
+        loading.wait()
+
+    try:
+        profile_path = artifact_path(name, version, "profile.json")
+        if os.path.exists(profile_path):
+            with open(profile_path) as fp:
+                profile = json.load(fp)
+        else:
+            if execution_backend(name) == "pandas":
+                profile = profile_dataframe(load_dataframe(name))
+            else:
+                # Too large to load at once, so it is profiled column by column.
+                scan = EXECUTION_BACKENDS[execution_backend(name)]["scan"]
+                columns = list(read_page(name, 0, 0).columns)
+                profile = {"rows": 0, "columns": {}}
+                for column in columns:
+                    series = scan(name, [column], ())[column]
+                    profile["rows"] = len(series)
+                    profile["columns"][column] = profile_column(series)
+            os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+            with open(profile_path + ".tmp", "w") as fp:
+                json.dump(profile, fp)
+            os.replace(profile_path + ".tmp", profile_path)
+        with dataframe_cache_lock:
+            profiles[key] = profile
+            while len(profiles) > ARROW_TABLE_CACHE_SIZE:
+                profiles.popitem(last=False)
+    finally:
+        with dataframe_cache_lock:
+            del profile_loading[key]
+        loading.set()
+    return profile
+
+
+def aggregate(name, plan, group_columns, function, value_columns):
+    """Group a filtered view of an uploaded file and aggregate its value columns.
+
+    Results are cached per file version, filter plan, grouping and function
+    for every session of this process. For sum, count, min and max a coarser
+    grouping is rolled up from a cached finer one whose extra columns have no
+    missing values, and groupings the cube of the file covers are answered
+    from it. Only when none of these apply is the file scanned, by the
+    execution backend of the upload.
+    """
+    global aggregates_bytes
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    plan = tuple(sorted(plan, key=repr))
+    group_columns = list(group_columns)
+    value_columns = [column for column in value_columns if column not in group_columns]
+    key = (path,) + file_version(path) + (plan, function)
+    key += (tuple(group_columns), tuple(value_columns))
+    finer = []
+    with dataframe_cache_lock:
+        if key in aggregates:
+            aggregates.move_to_end(key)
+            return aggregates[key]
+        if function in ROLLUP_FUNCTIONS:
+            finer = sorted(
+                (
+                    (cached_key[5], cached)
+                    for cached_key, cached in aggregates.items()
+                    if cached_key[:5] == key[:5]
+                    and set(cached_key[5]) > set(group_columns)
+                    and set(cached_key[6]) >= set(value_columns)
+                ),
+                key=lambda item: len(item[1]),
+            )
+    result = None
+    if finer:
+        # Groupings leave out the rows missing one of their values, so only a
+        # finer grouping whose extra columns have no missing values holds all
+        # the rows of a coarser one.
+        columns = load_profile(name)["columns"]
+        for finer_columns, cached in finer:
+            if all(
+                columns.get(column, {}).get("nulls", 1) == 0
+                for column in set(finer_columns) - set(group_columns)
+            ):
+                result = (
+                    cached.groupby(group_columns, observed=True)[value_columns]
+                    .agg(ROLLUP_FUNCTIONS[function])
+                    .reset_index()
+                )
+                break
+    if result is None:
+        result = aggregate_from_cube(name, plan, group_columns, function, value_columns)
+    if result is None:
+        result = EXECUTION_BACKENDS[execution_backend(name)]["aggregate"](
+            name, plan, group_columns, function, value_columns
+        )
+    size = int(result.memory_usage(deep=True).sum())
+    with dataframe_cache_lock:
+        if key not in aggregates and size <= AGGREGATE_CACHE_BYTES:
+            aggregates[key] = result
+            aggregates_bytes += size
+            while aggregates_bytes > AGGREGATE_CACHE_BYTES:
+                _, evicted = aggregates.popitem(last=False)
+                aggregates_bytes -= int(evicted.memory_usage(deep=True).sum())
+    return result
+
+
+def build_cube(name):
+    """Materialise partial aggregates of an upload over its group by dimensions.
+
+    The dimensions are the low-cardinality columns also offered for grouping,
+    from the lowest cardinality up as long as the cube stays under
+    CUBE_MAX_CELLS cells. Every numeric column, dimensions included, gets its
+    sum, count, min and max per cell, from which any coarser grouping and the
+    mean follow. Uploads running out of core are left to DuckDB instead.
+    """
+    if not BUILD_CUBES or execution_backend(name) != "pandas":
+        return None
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    version = file_version(path)
+    profile = load_profile(name)
+    candidates = sorted(
+        (
+            (column_profile["distinct"], column)
+            for column, column_profile in profile["columns"].items()
+            if column_profile["distinct_exact"]
+            and 0 < column_profile["distinct"] <= CUBE_MAX_CARDINALITY
+            and column_profile["distinct"] + (column_profile["nulls"] > 0)
+            < profile["rows"] / 2
+        ),
+        key=lambda candidate: candidate[0],
+    )
+    dimensions = []
+    cells = 1
+    for distinct, column in candidates:
+        if cells * distinct > CUBE_MAX_CELLS:
+            break
+        dimensions.append(column)
+        cells *= distinct
+    if not dimensions:
+        return None
+    # Only numbers and dates have a range in the profile.
+    dataframe = load_dataframe(
+        name,
+        columns=dimensions
+        + [
+            column
+            for column, column_profile in profile["columns"].items()
+            if column not in dimensions and column_profile["min"] is not None
+        ],
+    )
+    # A numeric dimension such as a quantity can still be summed.
+    measures = [
+        column
+        for column in dataframe.columns
+        if is_continuous(dataframe[column])
+        and not pd.api.types.is_datetime64_any_dtype(dataframe[column].dtype)
+    ]
+    if not measures:
+        return None
+    # The dimensions are grouped by as they are, so filters on the cube compare
+    # with the same dtypes as filters on the upload. Unnamed, as pandas leaves
+    # a column out of the aggregates when it is also one of the keys.
+    values = widen_floats(dataframe[measures], measures)
+    # Missing dimension values get cells of their own, so grouping by some of
+    # the dimensions still counts the rows missing one of the others.
+    cube = (
+        values.groupby(
+            [dataframe[column].rename(None) for column in dimensions],
+            observed=True,
+            dropna=False,
+        )
+        .agg(list(CUBE_FUNCTIONS))
+        .rename_axis(dimensions)
+    )
+    cube.columns = [
+        "{}|{}".format(function, column) for column, function in cube.columns
+    ]
+    cube = cube.reset_index()
+    cube_path = artifact_path(name, version, "cube.parquet")
+    os.makedirs(os.path.dirname(cube_path), exist_ok=True)
+    cube.to_parquet(cube_path + ".tmp", index=False)
+    os.replace(cube_path + ".tmp", cube_path)
+    spec_path = artifact_path(name, version, "cube.json")
+    with open(spec_path + ".tmp", "w") as fp:
+        json.dump({"dimensions": dimensions, "measures": measures}, fp)
+    os.replace(spec_path + ".tmp", spec_path)
+    remove_stale_artifacts(name)
+    return cube_path
+
+
+def load_cube(name):
+    """Return the (spec, Dataframe) cube of an uploaded file, or None if not built yet."""
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    version = file_version(path)
+    key = (path,) + version
+    with dataframe_cache_lock:
+        if key in cubes:
+            cubes.move_to_end(key)
+            return cubes[key]
+    spec_path = artifact_path(name, version, "cube.json")
+    if not os.path.exists(spec_path):
+        return None
+    with open(spec_path) as fp:
+        spec = json.load(fp)
+    cells = pd.read_parquet(artifact_path(name, version, "cube.parquet"))
+    if any(
+        cells[column].dtype == "float32"
+        for column in cells.columns
+        if column.startswith("sum|")
+    ):
+        # Summed in float32 by an older build, which loses precision.
+        return None
+    cube = (spec, cells)
+    with dataframe_cache_lock:
+        cubes[key] = cube
+        while len(cubes) > ARROW_TABLE_CACHE_SIZE:
+            cubes.popitem(last=False)
+    return cube
+
+
+def aggregate_from_cube(name, plan, group_columns, function, value_columns):
+    """Answer a group by from the cube of a file, or return None if it can't.
+
+    The grouping and every filtered column have to be dimensions of the cube
+    and every value column one of its measures.
+    """
+    cube = load_cube(name)
+    if cube is None or function not in CUBE_FUNCTIONS + ("mean",):
+        return None
+    spec, cells = cube
+    dimensions = set(spec["dimensions"])
+    if not (
+        set(group_columns) <= dimensions
+        and {predicate[1] for predicate in plan} <= dimensions
+        and set(value_columns) <= set(spec["measures"])
+    ):
+        return None
+    mask = np.ones(len(cells), dtype=bool)
+    for kind, column, argument in plan:
+        mask &= predicate_mask(cells[column], kind, argument)
+    grouped = cells[mask].groupby(group_columns, observed=True)
+    # Start from the groups, so an empty result still has the group columns.
+    result = grouped.size().to_frame()[[]]
+    for column in value_columns:
+        if function == "mean":
+            result[column] = (
+                grouped["sum|" + column].sum() / grouped["count|" + column].sum()
+            )
+        else:
+            result[column] = grouped["{}|{}".format(function, column)].agg(
+                ROLLUP_FUNCTIONS[function]
+            )
+    return result.reset_index()
+
+
+def aggregate_dataframe(name, plan, group_columns, function, value_columns):
+    """Group the rows of an upload matching a filter plan in pandas."""
+    dataframe = widen_floats(
+        scan_dataframe(name, group_columns + value_columns, plan), value_columns
+    )
+    return (
+        dataframe.groupby(group_columns, observed=True)[value_columns]
+        .agg(function)
+        .reset_index()
+    )
+
+
+def widen_floats(dataframe, columns):
+    """Convert the float32 `columns` of a Dataframe to float64 for aggregating.
+
+    Compact schemas store floats as float32 when no value changes, but
+    sums of float32 columns are accumulated in float32 and lose precision.
+    """
+    widened = {
+        column: dataframe[column].astype("float64")
+        for column in columns
+        if dataframe[column].dtype == "float32"
+    }
+    return dataframe.assign(**widened) if widened else dataframe
+
+
+def page_dataframe(name, plan, start, length):
+    """Return a page of the rows of an upload matching a filter plan, and their count.
+
+    Only the filtered columns are scanned, the page is read row by row.
+    """
+    positions = scan_dataframe(
+        name, [predicate[1] for predicate in plan], plan
+    ).index.to_numpy()
+    return read_rows(name, positions[start : start + length]), len(positions)
+
+
+def few_distinct_columns(name, plan, columns, threshold):
+    """Return the `columns` of a filtered view with fewer than `threshold` values."""
+    view = scan_dataframe(name, columns, plan)
+    return [column for column in columns if has_few_distinct(view[column], threshold)]
+
+
+def quote_identifier(column):
+    """Quote a column name for SQL."""
+    return '"{}"'.format(column.replace('"', '""'))
+
+
+def duckdb_cursor():
+    """Return a cursor on the DuckDB database shared by the out-of-core backend.
+
+    Intermediate results larger than its memory limit spill to disk next to
+    the artifacts of the uploads.
+    """
+    global duckdb_connection
+    with dataframe_cache_lock:
+        if duckdb_connection is None:
+            config = {"temp_directory": os.path.join(ARTIFACT_DIRECTORY, ".duckdb")}
+            if DUCKDB_MEMORY_LIMIT:
+                config["memory_limit"] = DUCKDB_MEMORY_LIMIT
+            duckdb_connection = duckdb.connect(config=config)
+    return duckdb_connection.cursor()
+
+
+def duckdb_source(cursor, name):
+    """Return the SQL scanning an upload and the types of its columns.
+
+    CSV files are scanned through their Parquet copy once it exists and
+    Arrow files through their memory map, so only the columns and row
+    groups a query needs are read. Text columns the schema of the upload
+    parses as dates are cast to timestamps, as the pandas backend sees them.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    version = file_version(path)
+    extension = os.path.splitext(name)[1]
+    if extension in ARROW_EXTENSIONS:
+        cursor.register("upload", open_arrow_table(name, version))
+        source = "upload"
+    else:
+        sidecar = artifact_path(name, version, "parquet")
+        if os.path.exists(sidecar):
+            source = "read_parquet('{}')".format(sidecar.replace("'", "''"))
+        else:
+            source = "read_csv_auto('{}')".format(path.replace("'", "''"))
+    types = dict(
+        (column, dtype)
+        for column, dtype, *_ in cursor.execute(
+            "DESCRIBE SELECT * FROM {}".format(source)
+        ).fetchall()
+    )
+    schema = load_schema(name, version)
+    dates = [
+        column
+        for column, dtype in (schema["dtypes"] if schema else {}).items()
+        if dtype.startswith("datetime64") and types.get(column) == "VARCHAR"
+    ]
+    if dates:
+        source = "(SELECT * REPLACE ({}) FROM {})".format(
+            ", ".join(
+                "TRY_CAST({0} AS TIMESTAMP) AS {0}".format(quote_identifier(column))
+                for column in dates
+            ),
+            source,
+        )
+        types.update(dict.fromkeys(dates, "TIMESTAMP"))
+    return source, types
+
+
+def duckdb_filters(plan, types):
+    """Translate a filter plan into a SQL WHERE clause and its parameters.
+
+    Arguments are cast to the type of their column, values that don't cast
+    match nothing.
+    """
+    clauses = []
+    parameters = []
+    for kind, column, argument in plan:
+        identifier = quote_identifier(column)
+        value = "TRY_CAST(? AS {})".format(types[column])
+        if kind == "isin":
+            clauses.append(
+                "{} IN ({})".format(identifier, ", ".join([value] * len(argument)))
+            )
+            parameters.extend(argument)
+        elif kind == "range":
+            low, high = argument
+            if low is not None:
+                clauses.append("{} >= {}".format(identifier, value))
+                parameters.append(low)
+            if high is not None:
+                clauses.append("{} <= {}".format(identifier, value))
+                parameters.append(high)
+        else:
+            clauses.append("{} = {}".format(identifier, value))
+            parameters.append(argument)
+    if not clauses:
+        return "", parameters
+    return "WHERE " + " AND ".join(clauses), parameters
+
+
+def duckdb_scan(name, columns, plan):
+    """Return the `columns` of the rows of an upload matching a filter plan."""
+    cursor = duckdb_cursor()
+    source, types = duckdb_source(cursor, name)
+    where, parameters = duckdb_filters(plan, types)
+    query = "SELECT {} FROM {} {}".format(
+        ", ".join(quote_identifier(column) for column in plot_columns(list(columns))),
+        source,
+        where,
+    )
+    return cursor.execute(query, parameters).df()
+
+
+def duckdb_aggregate(name, plan, group_columns, function, value_columns):
+    """Group the rows of an upload matching a filter plan in DuckDB.
+
+    Like pandas, rows missing one of the group by values are left out.
+    """
+    cursor = duckdb_cursor()
+    source, types = duckdb_source(cursor, name)
+    where, parameters = duckdb_filters(plan, types)
+    not_null = " AND ".join(
+        "{} IS NOT NULL".format(quote_identifier(column)) for column in group_columns
+    )
+    where = "{} AND {}".format(where, not_null) if where else "WHERE " + not_null
+    groups = ", ".join(quote_identifier(column) for column in group_columns)
+    values = ", ".join(
+        "{}({}) AS {}".format(
+            SQL_FUNCTIONS[function], quote_identifier(column), quote_identifier(column)
+        )
+        for column in value_columns
+    )
+    query = "SELECT {}{} FROM {} {} GROUP BY {} ORDER BY {}".format(
+        groups, ", " + values if values else "", source, where, groups, groups
+    )
+    return cursor.execute(query, parameters).df()
+
+
+def duckdb_page(name, plan, start, length):
+    """Return a page of the rows of an upload matching a filter plan, and their count."""
+    cursor = duckdb_cursor()
+    source, types = duckdb_source(cursor, name)
+    where, parameters = duckdb_filters(plan, types)
+    rows = cursor.execute(
+        "SELECT count(*) FROM {} {}".format(source, where), parameters
+    ).fetchone()[0]
+    page = cursor.execute(
+        "SELECT * FROM {} {} LIMIT {} OFFSET {}".format(
+            source, where, int(length), int(start)
+        ),
+        parameters,
+    ).df()
+    return page, rows
+
+
+def duckdb_few_distinct(name, plan, columns, threshold):
+    """Return the `columns` of a filtered view with fewer than `threshold` values.
+
+    Distinct values are estimated with HyperLogLog in a single scan.
+    """
+    if not columns:
+        return []
+    cursor = duckdb_cursor()
+    source, types = duckdb_source(cursor, name)
+    where, parameters = duckdb_filters(plan, types)
+    query = "SELECT {} FROM {} {}".format(
+        ", ".join(
+            "approx_count_distinct({0}) + (count({0}) < count(*))::INTEGER".format(
+                quote_identifier(column)
+            )
+            for column in columns
+        ),
+        source,
+        where,
+    )
+    distinct = cursor.execute(query, parameters).fetchone()
+    return [column for column, count in zip(columns, distinct) if count < threshold]
+
+
+def duckdb_convert_to_parquet(name, version, sidecar):
+    """Write the Parquet copy of a CSV file by streaming it through DuckDB."""
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    duckdb_cursor().execute(
+        "COPY (SELECT * FROM read_csv_auto('{}')) TO '{}' "
+        "(FORMAT PARQUET, ROW_GROUP_SIZE {})".format(
+            path.replace("'", "''"),
+            sidecar.replace("'", "''"),
+            PARQUET_ROW_GROUP_SIZE,
+        )
+    )
+
+
+# group by function of the Dash controls: its SQL aggregate
+SQL_FUNCTIONS = {
+    "mean": "avg",
+    "min": "min",
+    "max": "max",
+    "count": "count",
+    "sum": "sum",
+}
+# backend: the functions running each step of a callback on it
+EXECUTION_BACKENDS = {
+    "pandas": {
+        "scan": scan_dataframe,
+        "aggregate": aggregate_dataframe,
+        "page": page_dataframe,
+        "few_distinct": few_distinct_columns,
+    },
+    "duckdb": {
+        "scan": duckdb_scan,
+        "aggregate": duckdb_aggregate,
+        "page": duckdb_page,
+        "few_distinct": duckdb_few_distinct,
+    },
+}
+
+
+def execution_backend(name):
+    """Return the name of the backend that filters and aggregates an upload.
+
+    DATASET_BACKENDS picks one per upload, otherwise uploads larger than
+    OUT_OF_CORE_BYTES run out of core. Without DuckDB installed everything
+    runs in pandas.
+    """
+    backend = dataset_backends.get(name)
+    if backend is None:
+        path = os.path.join(UPLOAD_DIRECTORY, name)
+        if os.path.exists(path) and os.path.getsize(path) > OUT_OF_CORE_BYTES:
+            backend = "duckdb"
+    if backend not in EXECUTION_BACKENDS or (backend == "duckdb" and duckdb is None):
+        backend = "pandas"
+    return backend
+
+
+def is_continuous(series):
+    """Tell whether a Series holds numbers or dates that can be placed on an axis."""
+    return pd.api.types.is_datetime64_any_dtype(series.dtype) or (
+        pd.api.types.is_numeric_dtype(series.dtype)
+        and not pd.api.types.is_bool_dtype(series.dtype)
+    )
+
+
+def numeric_values(series):
+    """Return a numeric or date Series as float64 values, or None for other types."""
+    if not is_continuous(series):
+        return None
+    try:
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            values = series.to_numpy("datetime64[ns]").view("int64").astype("float64")
+            values[series.isna().to_numpy()] = np.nan
+            return values
+        return series.to_numpy(dtype="float64", na_value=np.nan)
+    except (TypeError, ValueError):
+        return None
+
+
+def lttb_indices(x, y, points):
+    """Pick `points` positions of an x-sorted line with Largest-Triangle-Three-Buckets.
+
+    Each bucket keeps the point spanning the largest triangle with the point
+    kept from the previous bucket and the average of the next one, which
+    preserves the peaks and troughs a plain stride would drop.
+    """
+    count = len(x)
+    if points >= count or points < 3:
+        return np.arange(count)
+    every = (count - 2) / (points - 2)
+    indices = np.empty(points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = count - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start = int(bucket * every) + 1
+        stop = int((bucket + 1) * every) + 1
+        next_stop = min(int((bucket + 2) * every) + 1, count)
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        indices[bucket + 1] = previous
+    return indices
+
+
+def downsample(dataframe, chart_type, x_axis, y_axis, trace_columns):
+    """Thin out the points of large line and scatter plots before plotting.
+
+    Every trace, i.e. every combination of `trace_columns`, is reduced on its
+    own: lines keep DOWNSAMPLE_POINTS points picked by LTTB along the sorted
+    x axis, scatter plots keep one point per cell of a SCATTER_GRID grid.
+    Other chart types and non-numeric axes are returned unchanged.
+    """
+    if chart_type not in ("line", "scatter") or len(dataframe) <= DOWNSAMPLE_THRESHOLD:
+        return dataframe
+    x = numeric_values(dataframe[x_axis])
+    y = numeric_values(dataframe[y_axis])
+    if x is None or y is None:
+        return dataframe
+    groups = [
+        column
+        for column in dict.fromkeys(trace_columns)
+        if column and column not in (x_axis, y_axis)
+    ]
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.any():
+        return dataframe
+    if groups:
+        codes = dataframe.groupby(groups, sort=False, observed=True, dropna=False)
+        codes = codes.ngroup().to_numpy()
+    else:
+        codes = np.zeros(len(dataframe), dtype=np.int64)
+
+    if chart_type == "line":
+        keep = []
+        order = np.lexsort((x, codes))
+        order = order[finite[order]]
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        for positions in np.split(order, bounds):
+            keep.append(
+                positions[lttb_indices(x[positions], y[positions], DOWNSAMPLE_POINTS)]
+            )
+        rows = np.concatenate(keep) if keep else np.zeros(0, dtype=np.int64)
+    else:
+        cells = codes.astype(np.int64) * SCATTER_GRID[0] * SCATTER_GRID[1]
+        axes = ((x, SCATTER_GRID[0], SCATTER_GRID[1]), (y, SCATTER_GRID[1], 1))
+        for values, size, stride in axes:
+            low = np.nanmin(values[finite])
+            span = np.nanmax(values[finite]) - low or 1
+            cell = np.clip((values - low) / span * (size - 1), 0, size - 1)
+            cells += np.nan_to_num(cell).astype(np.int64) * stride
+        rows = np.flatnonzero(finite)
+        rows = np.sort(rows[np.unique(cells[rows], return_index=True)[1]])
+    return dataframe.iloc[rows]
+
+
+def relayout_range(relayout, axis):
+    """Return the (low, high) range a relayout event zoomed an axis to.
+
+    Returns None when the event did not set the range of that axis and
+    "auto" when it reset the axis to its full extent.
+    """
+    if relayout.get(axis + ".autorange"):
+        return "auto"
+    if axis + ".range[0]" in relayout and axis + ".range[1]" in relayout:
+        return relayout[axis + ".range[0]"], relayout[axis + ".range[1]"]
+    if axis + ".range" in relayout:
+        return tuple(relayout[axis + ".range"])
+    return None
+
+
+def rasterise(dataframe, chart_type, x_axis, y_axis, x_range=None, y_range=None):
+    """Aggregate the points of a dense chart into a RASTER_SHAPE grid of counts.
+
+    Only the points inside `x_range` and `y_range` are binned, so zooming in
+    renders the visible extent at full resolution while the figure sent to
+    the browser stays the same size whatever the number of rows. Both axes
+    have to hold numbers or dates.
+    """
+    extents = []
+    values = []
+    for axis, axis_range in ((x_axis, x_range), (y_axis, y_range)):
+        axis_values = numeric_values(dataframe[axis])
+        is_date = pd.api.types.is_datetime64_any_dtype(dataframe[axis].dtype)
+        if axis_range is None or axis_range == "auto":
+            finite = axis_values[np.isfinite(axis_values)]
+            axis_range = (finite.min(), finite.max()) if len(finite) else (0.0, 1.0)
+        elif is_date:
+            axis_range = tuple(float(pd.Timestamp(v).value) for v in axis_range)
+        else:
+            axis_range = tuple(float(v) for v in axis_range)
+        if axis_range[0] == axis_range[1]:
+            axis_range = (axis_range[0] - 0.5, axis_range[1] + 0.5)
+        extents.append((axis_range, is_date))
+        values.append(axis_values)
+    finite = np.isfinite(values[0]) & np.isfinite(values[1])
+    counts, x_edges, y_edges = np.histogram2d(
+        values[0][finite],
+        values[1][finite],
+        bins=RASTER_SHAPE,
+        range=[extents[0][0], extents[1][0]],
+    )
+    visible = int(counts.sum())
+    centers = []
+    for edges, (_, is_date) in zip((x_edges, y_edges), extents):
+        center = (edges[:-1] + edges[1:]) / 2
+        centers.append(pd.to_datetime(center.astype("int64")) if is_date else center)
+    counts = counts.T
+    if chart_type == "density_contour":
+        trace = go.Contour(x=centers[0], y=centers[1], z=counts, colorscale="Viridis")
+    else:
+        counts[counts == 0] = np.nan
+        trace = go.Heatmap(x=centers[0], y=centers[1], z=counts, colorscale="Viridis")
+    fig = go.Figure(trace)
+    fig.update_layout(
+        xaxis_title=x_axis,
+        yaxis_title=y_axis,
+        # Keep the user's zoom when the zoomed-in grid replaces the figure.
+        uirevision="{}-{}".format(x_axis, y_axis),
+    )
+    fig.add_annotation(
+        text="Rasterised {:,} points into a {} x {} grid".format(
+            visible, RASTER_SHAPE[0], RASTER_SHAPE[1]
+        ),
+        xref="paper",
+        yref="paper",
+        x=1,
+        y=1,
+        xanchor="right",
+        yanchor="top",
+        showarrow=False,
+        bgcolor="rgba(255, 255, 255, 0.8)",
+    )
+    return fig
+
+
+def plotly_js_version():
+    """Return the version of the plotly.js served with dcc.Graph, e.g. (2, 25, 2).
+
+    Older Dash bundles plotly.js with dcc, newer Dash serves the copy of the
+    plotly package.
+    """
+    directory = os.path.dirname(inspect.getfile(dcc.Graph))
+    for path in glob.glob(os.path.join(directory, "*plotly*.js")):
+        with open(path, errors="ignore") as fp:
+            match = re.search(r"plotly\.js v(\d+)\.(\d+)\.(\d+)", fp.read(1024))
+        if match:
+            return tuple(int(part) for part in match.groups())
+    match = re.match(r"(\d+)\.(\d+)\.(\d+)", get_plotlyjs_version())
+    return tuple(int(part) for part in match.groups()) if match else None
+
+
+def binary_figures():
+    """Tell whether figures are sent with base64 typed arrays."""
+    global BINARY_FIGURES
+    if BINARY_FIGURES == "auto":
+        version = plotly_js_version()
+        BINARY_FIGURES = "1" if version is not None and version >= (2, 28) else "0"
+    return BINARY_FIGURES == "1"
+
+
+def encode_array(values):
+    """Encode a numeric NumPy array as a plotly.js base64 typed array.
+
+    Returns None for arrays plotly.js can't take as typed arrays.
+    """
+    if values.dtype.kind not in "iuf" or values.ndim > 2:
+        return None
+    if values.dtype.kind in "iu" and values.dtype.itemsize == 8:
+        info = np.iinfo("int32")
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            values = values.astype("float64")
+        else:
+            values = values.astype("int32")
+    values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+    dtype = values.dtype.str[1:]
+    if dtype not in BINARY_DTYPES:
+        return None
+    encoded = {"dtype": dtype, "bdata": base64.b64encode(values.data).decode()}
+    if values.ndim == 2:
+        encoded["shape"] = "{}, {}".format(*values.shape)
+    return encoded
+
+
+def encode_value(value):
+    """Replace the numeric arrays nested in a figure property by typed arrays."""
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, np.ndarray):
+        encoded = encode_array(value)
+        return value if encoded is None else encoded
+    return value
+
+
+def decode_value(value):
+    """Replace the typed arrays nested in a figure property by lists."""
+    if isinstance(value, dict):
+        if "bdata" in value and "dtype" in value:
+            values = np.frombuffer(
+                base64.b64decode(value["bdata"]), dtype="<" + value["dtype"]
+            )
+            if "shape" in value:
+                values = values.reshape(
+                    [int(size) for size in value["shape"].split(",")]
+                )
+            return values.tolist()
+        return {key: decode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [decode_value(item) for item in value]
+    return value
+
+
+def encode_figure(fig):
+    """Return a figure as a dict that serialises quickly and compactly.
+
+    Only the parts of the template styling trace types the figure has are
+    kept, and numeric arrays become base64 typed arrays when the browser
+    decodes them instead of lists of decimal text. Otherwise the typed arrays
+    of newer plotly versions are turned back into lists.
+    """
+    figure = fig.to_plotly_json()
+    template = figure["layout"].get("template")
+    if template is not None and "data" in template:
+        types = {trace.get("type", "scatter") for trace in figure["data"]}
+        template["data"] = {
+            trace_type: traces
+            for trace_type, traces in template["data"].items()
+            if trace_type in types
+        }
+    if binary_figures():
+        figure["data"] = [encode_value(trace) for trace in figure["data"]]
+    else:
+        figure["data"] = decode_value(figure["data"])
+        figure["layout"] = decode_value(figure["layout"])
+    return figure
+
+
+def write_plot(fig, content, path, extension):
+    """Write a saved plot through a temporary file.
+
+    HTML files load the copy of plotly.js next to them instead of inlining it.
+    A failed export leaves its error next to where the plot would have been.
+    """
+    os.makedirs(PLOT_DIRECTORY, exist_ok=True)
+    try:
+        if extension == "html":
+            fig.write_html(path + ".tmp", include_plotlyjs="directory")
+        elif extension == "png":
+            fig.write_image(path + ".tmp", format="png")
+        else:
+            with open(path + ".tmp", "w") as fp:
+                fp.write(content)
+        os.replace(path + ".tmp", path)
+    except Exception as error:
+        with open(path + ".error", "w") as fp:
+            fp.write(str(error).strip() or type(error).__name__)
+        raise
+    return path
+
+
+def save_plot(fig, title, extension):
+    """Queue the export of a figure to PLOT_DIRECTORY and return its path.
+
+    Files are named after a hash of the figure, so saving the same plot again
+    reuses the file written the first time.
+    """
+    content = fig.to_json()
+    digest = hashlib.sha256((extension + content).encode()).hexdigest()[:12]
+    path = os.path.join(PLOT_DIRECTORY, "{}-{}.{}".format(title, digest, extension))
+    with jobs_lock:
+        if os.path.exists(path) or path in export_jobs:
+            return path
+        if os.path.exists(path + ".error"):
+            os.remove(path + ".error")
+        job = export_jobs[path] = export_executor.submit(
+            write_plot, fig, content, path, extension
+        )
+    # Finished exports are told apart by their file or their error.
+    job.add_done_callback(lambda job: export_jobs.pop(path, None))
+    return path
+
+
+def export_status(path):
+    """Describe the export of a saved plot as a (message, pending) tuple."""
+    if os.path.exists(path):
+        return "Plot saved in {}.".format(path), False
+    try:
+        with open(path + ".error") as fp:
+            return "Saving the plot failed: {}".format(fp.read()), False
+    except OSError:
+        pass
+    if path in export_jobs or WORKER_PROCESSES > 1:
+        # With several workers, the export may run in another one.
+        return "Plot is being saved in {}.".format(path), True
+    return "", False
+
+
+def file_download_link(filename):
+    """Create a Plotly Dash 'A' element that downloads a file from the app."""
+    location = "/download/{}".format(urlquote(filename))
+    return html.A(filename, href=location)
+
+
+def uploaded_files():
+    """List the files in the upload directory."""
+    files = []
+    for filename in os.listdir(UPLOAD_DIRECTORY):
+        path = os.path.join(UPLOAD_DIRECTORY, filename)
+        if os.path.isfile(path):
+            files.append(filename)
+    return files
+
+
+def metric_label(value):
+    """Escape a value for a label of the Prometheus text format."""
+    return (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def resident_bytes():
+    """Return the resident memory of this process, or 0 where it is unknown."""
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def record_metric(
+    callback,
+    stage,
+    seconds,
+    rows_in=None,
+    rows_out=None,
+    memory=0,
+    response_bytes=0,
+):
+    """Add one run of a stage to the metrics exported on /metrics."""
+    with metrics_lock:
+        values = stage_metrics.setdefault((callback, stage), [0, 0.0, 0, 0, 0, 0])
+        values[0] += 1
+        values[1] += seconds
+        values[2] += rows_in or 0
+        values[3] += rows_out or 0
+        values[4] += memory
+        values[5] += response_bytes
+
+
+def start_profiler():
+    """Start profiling the current thread, unless another profile is running."""
+    if not PROFILE_SLOWEST or not profiler_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        profiler_lock.release()
+        return None
+    return profiler
+
+
+def stop_profiler(profiler, label, seconds):
+    """Stop a profiler and keep its statistics if it is one of the slowest."""
+    if profiler is None:
+        return
+    profiler.disable()
+    profiler_lock.release()
+    with metrics_lock:
+        if (
+            len(slowest_profiles) >= PROFILE_SLOWEST
+            and seconds <= min(slowest_profiles)[0]
+        ):
+            return
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(30)
+    with metrics_lock:
+        slowest_profiles.append((seconds, label, stream.getvalue()))
+        slowest_profiles.sort(reverse=True)
+        del slowest_profiles[PROFILE_SLOWEST:]
+
+
+def end_stage(job, rows=None):
+    """Record the metrics of the stage a job is leaving, which produced `rows`."""
+    stage = job.pop("stage", None)
+    if stage is None:
+        return
+    message, start, memory, rows_in = stage
+    seconds = time.perf_counter() - start
+    job.setdefault("timings", []).append((message.rstrip("."), seconds))
+    record_metric(
+        job["kind"],
+        message.rstrip(".").lower(),
+        seconds,
+        rows_in,
+        rows,
+        resident_bytes() - memory,
+    )
+
+
+def new_job(kind, session=None):
+    """Return the state of a new job of some kind, before it is run."""
+    return {
+        "progress": "Queued...",
+        "cancelled": threading.Event(),
+        "kind": kind,
+        "id": uuid.uuid4().hex,
+        "session": session,
+    }
+
+
+def submit_job(session, kind, function, *args):
+    """Run `function(job, *args)` on the job pool and return the id of the job.
+
+    An earlier job of the same kind for the same session is superseded: it
+    is dropped from the queue, or stopped during its debounce window or at
+    its next report_progress call if it has already started.
+    """
+    job = new_job(kind, session)
+    job_id = job["id"]
+    if WORKER_PROCESSES > 1:
+        publish_job(job, "progress", job["progress"])
+        publish_job(job, "latest", job_id)
+    job["future"] = job_executor.submit(run_job, job, function, *args)
+    with jobs_lock:
+        previous = jobs.get(session_jobs.get((session, kind)))
+        if previous is not None:
+            previous["cancelled"].set()
+            previous["future"].cancel()
+        session_jobs[(session, kind)] = job_id
+        jobs[job_id] = job
+        while len(jobs) > JOB_HISTORY:
+            jobs.popitem(last=False)
+    return job_id
+
+
+def run_job(job, function, *args):
+    """Run a job unless a newer one supersedes it within JOB_DEBOUNCE_SECONDS.
+
+    With several worker processes, the outcome is published for polls that
+    other workers serve.
+    """
+    start = time.perf_counter()
+    profiler = None
+    try:
+        if job["cancelled"].wait(JOB_DEBOUNCE_SECONDS) or superseded(job):
+            raise PreventUpdate
+        profiler = start_profiler()
+        result = function(job, *args)
+    except Exception as error:
+        if WORKER_PROCESSES > 1:
+            # Superseded jobs have no error to show, their polls just stop.
+            message = None if isinstance(error, PreventUpdate) else str(error)
+            publish_job(job, "result", json.dumps({"error": message}))
+        raise
+    finally:
+        if INSTRUMENT:
+            end_stage(job)
+        stop_profiler(profiler, job["kind"] + " job", time.perf_counter() - start)
+    if WORKER_PROCESSES > 1:
+        publish_job(
+            job, "result", json.dumps({"result": result}, cls=PlotlyJSONEncoder)
+        )
+    return result
+
+
+def report_progress(job, message, rows=None):
+    """Record the stage a job has reached, stopping it if it has been superseded.
+
+    With INSTRUMENT on, the previous stage is timed, and `rows` are the rows
+    it produced.
+    """
+    if superseded(job):
+        raise PreventUpdate
+    if INSTRUMENT:
+        end_stage(job, rows)
+        job["stage"] = (message, time.perf_counter(), resident_bytes(), rows)
+    job["progress"] = message
+    if WORKER_PROCESSES > 1:
+        publish_job(job, "progress", message)
+
+
+def superseded(job):
+    """Return whether a newer job of the same session and kind has been submitted.
+
+    With several worker processes, the newer job may have been submitted to
+    any of them.
+    """
+    if not job["cancelled"].is_set() and WORKER_PROCESSES > 1:
+        try:
+            with open(job_path(job["session"], job["kind"])) as fp:
+                latest = fp.read()
+        except OSError:
+            latest = job["id"]
+        if latest != job["id"]:
+            job["cancelled"].set()
+    return job["cancelled"].is_set()
+
+
+def job_path(*parts):
+    """Return the file a job, or the latest job of a session, is published in."""
+    return os.path.join(
+        JOB_DIRECTORY, hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+    )
+
+
+def publish_job(job, what, value):
+    """Publish the progress or result of a job, or the latest job of its session.
+
+    Results are published as JSON, never pickled: the files share a directory
+    tree with the uploads. Files older than JOB_FILE_SECONDS are swept while
+    publishing.
+    """
+    global last_job_sweep
+    if what == "latest":
+        path = job_path(job["session"], job["kind"])
+    else:
+        path = job_path(job["id"], what)
+    os.makedirs(JOB_DIRECTORY, exist_ok=True)
+    temporary = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    with open(temporary, "w") as fp:
+        fp.write(value)
+    os.replace(temporary, path)
+    now = time.time()
+    if now - last_job_sweep > JOB_FILE_SECONDS / 60:
+        last_job_sweep = now
+        for entry in os.scandir(JOB_DIRECTORY):
+            try:
+                if now - entry.stat().st_mtime > JOB_FILE_SECONDS:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def job_outputs(job_id, count):
+    """Return the `count` outputs of a job, or no updates while it is running.
+
+    Two more outputs follow: the progress of the job and whether polling
+    can stop.
+    """
+    with jobs_lock:
+        job = jobs.get(job_id)
+    if job is None:
+        return published_job_outputs(job_id, count)
+    done, _ = wait([job["future"]], timeout=JOB_WAIT_SECONDS)
+    if not done:
+        return [dash.no_update] * count + [job["progress"], False]
+    if has_request_context() and "stage_timings" in g:
+        g.stage_timings = job.get("timings", [])
+    return finished_job_outputs(job["future"].result, count)
+
+
+def published_job_outputs(job_id, count):
+    """Return the outputs of a job another worker process runs, like job_outputs."""
+    if WORKER_PROCESSES <= 1:
+        return [dash.no_update] * count + ["", True]
+    result_path = job_path(job_id, "result")
+    progress_path = job_path(job_id, "progress")
+    if not os.path.exists(progress_path):
+        return [dash.no_update] * count + ["", True]
+    deadline = time.monotonic() + JOB_WAIT_SECONDS
+    while not os.path.exists(result_path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    try:
+        with open(result_path) as fp:
+            outcome = json.load(fp)
+    except OSError:
+        try:
+            with open(progress_path) as fp:
+                return [dash.no_update] * count + [fp.read(), False]
+        except OSError:
+            return [dash.no_update] * count + ["", True]
+    except ValueError:
+        return [dash.no_update] * count + ["", True]
+
+    def result():
+        if "result" in outcome:
+            return outcome["result"]
+        if outcome.get("error") is None:
+            raise PreventUpdate
+        raise RuntimeError(outcome["error"])
+
+    return finished_job_outputs(result, count)
+
+
+def finished_job_outputs(result, count):
+    """Return the outputs of a finished job, given a function returning its result."""
+    try:
+        result = result()
+    except (PreventUpdate, CancelledError):
+        return [dash.no_update] * count + ["", True]
+    except Exception as error:
+        return [dash.no_update] * count + ["Failed: {}".format(error), True]
+    return list(result) + ["", True]
+
+
+def result_database():
+    """Return the connection of this thread to the result cache."""
+    connection = getattr(result_connections, "connection", None)
+    if connection is None:
+        os.makedirs(os.path.dirname(RESULT_CACHE_PATH), exist_ok=True)
+        connection = sqlite3.connect(
+            RESULT_CACHE_PATH, timeout=30, isolation_level=None
+        )
+        # Readers in every worker process keep going while one of them writes.
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY, view TEXT, value BLOB, bytes INTEGER,
+                hits INTEGER, last_used REAL
+            );
+            CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+            CREATE TABLE IF NOT EXISTS views (
+                view TEXT PRIMARY KEY, kind TEXT, name TEXT, arguments TEXT,
+                requests INTEGER
+            );
+            """
+        )
+        result_connections.connection = connection
+    return connection
+
+
+def result_view(kind, name, arguments):
+    """Describe a table or figure of an upload for the result cache.
+
+    The view is the hash of what was asked for. Its key adds the version of
+    the upload, so results of a replaced file are never served. Returns None
+    if the cache is off or the upload is gone.
+    """
+    path = os.path.join(UPLOAD_DIRECTORY, name)
+    if not RESULT_CACHE_BYTES or not os.path.exists(path):
+        return None
+    arguments = json.dumps(arguments, sort_keys=True, cls=PlotlyJSONEncoder)
+    view = hashlib.sha256(json.dumps([kind, name, arguments]).encode()).hexdigest()
+    version = [RESULT_FORMAT, binary_figures(), list(file_version(path))]
+    return {
+        "kind": kind,
+        "name": name,
+        "arguments": arguments,
+        "view": view,
+        "key": hashlib.sha256(json.dumps([view, version]).encode()).hexdigest(),
+    }
+
+
+def load_result(view):
+    """Count a request of a view and return its cached result, or None on a miss."""
+    if view is None:
+        return None
+    try:
+        database = result_database()
+        database.execute(
+            "INSERT INTO views VALUES (?, ?, ?, ?, 1) "
+            "ON CONFLICT (view) DO UPDATE SET requests = requests + 1",
+            (view["view"], view["kind"], view["name"], view["arguments"]),
+        )
+        row = database.execute(
+            "SELECT value FROM results WHERE key = ?", (view["key"],)
+        ).fetchone()
+        if row is None:
+            return None
+        database.execute(
+            "UPDATE results SET hits = hits + 1, last_used = ? WHERE key = ?",
+            (time.time(), view["key"]),
+        )
+    except sqlite3.Error:
+        return None
+    return json.loads(row[0])
+
+
+def store_result(view, result):
+    """Store the result of a view, evicting the least recently used ones.
+
+    Results are stored serialised the way Dash sends them, so the cache
+    holds what the browser receives. Returns `result`.
+    """
+    if view is None:
+        return result
+    value = json.dumps(result, cls=PlotlyJSONEncoder)
+    if len(value) > RESULT_CACHE_BYTES:
+        return result
+    try:
+        database = result_database()
+        database.execute(
+            "INSERT INTO results VALUES (?, ?, ?, ?, 0, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+            "bytes = excluded.bytes, last_used = excluded.last_used",
+            (view["key"], view["view"], value, len(value), time.time()),
+        )
+        excess = (
+            database.execute("SELECT SUM(bytes) FROM results").fetchone()[0]
+            - RESULT_CACHE_BYTES
+        )
+        if excess > 0:
+            evicted = []
+            for key, size in database.execute(
+                "SELECT key, bytes FROM results ORDER BY last_used"
+            ):
+                if excess <= 0:
+                    break
+                evicted.append((key,))
+                excess -= size
+            database.executemany("DELETE FROM results WHERE key = ?", evicted)
+            database.execute(
+                "DELETE FROM views WHERE view NOT IN "
+                "(SELECT view FROM views ORDER BY requests DESC LIMIT ?)",
+                (RESULT_CACHE_VIEWS,),
+            )
+    except sqlite3.Error:
+        pass
+    return result
+
+
+def result_cache_info():
+    """Return the size and hit counters of the result cache."""
+    if not RESULT_CACHE_BYTES:
+        return {}
+    try:
+        entries, size, hits = (
+            result_database()
+            .execute("SELECT COUNT(*), SUM(bytes), SUM(hits) FROM results")
+            .fetchone()
+        )
+        requests = (
+            result_database().execute("SELECT SUM(requests) FROM views").fetchone()[0]
+        )
+    except sqlite3.Error as error:
+        return {"error": str(error)}
+    return {
+        "entries": entries,
+        "bytes": size or 0,
+        "hits": hits or 0,
+        "requests": requests or 0,
+        "budget": RESULT_CACHE_BYTES,
+    }
+
+
+def warm_result_cache(count):
+    """Compute the results of the `count` most requested views missing from the cache.
+
+    Only one worker process warms the cache, the others serve what it stores.
+    """
+    claim = claim_file(os.path.join(os.path.dirname(RESULT_CACHE_PATH), "warming"))
+    if claim is None:
+        return
+    try:
+        views = (
+            result_database()
+            .execute(
+                "SELECT kind, name, arguments FROM views "
+                "ORDER BY requests DESC LIMIT ?",
+                (count,),
+            )
+            .fetchall()
+        )
+        for kind, name, arguments in views:
+            view = result_view(kind, name, json.loads(arguments))
+            if view is None:
+                continue
+            if (
+                result_database()
+                .execute("SELECT 1 FROM results WHERE key = ?", (view["key"],))
+                .fetchone()
+            ):
+                continue
+            job = new_job(kind)
+            try:
+                if kind == "table":
+                    build_table(job, name, *json.loads(arguments))
+                else:
+                    build_figure(job, name, 0, 0, *json.loads(arguments), None)
+            except Exception:
+                # E.g. a column that is no longer in the upload.
+                pass
+            # Building the view counted it as requested once more.
+            result_database().execute(
+                "UPDATE views SET requests = requests - 1 WHERE view = ?",
+                (view["view"],),
+            )
+    finally:
+        os.remove(claim)
+
+
+# Callbacks
+@app.callback(
+    Output("file-list", "options"),
+    [
+        Input("upload-data", "filename"),
+        Input("upload-data", "contents"),
+        Input("chunked-upload-done", "n_clicks"),
+    ],
+)
+def update_output(uploaded_filenames, uploaded_file_contents, chunked_uploads):
+    """Save uploaded files and regenerate the file list."""
+    # dcc.Upload keeps its last files, which a chunked upload must not save again.
+    triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+    if (
+        "upload-data.contents" in triggered or "upload-data.filename" in triggered
+    ) and (uploaded_filenames is not None and uploaded_file_contents is not None):
+        for name, data in zip(uploaded_filenames, uploaded_file_contents):
+            save_file(name, data)
+            process_upload(name)
+
+    files = uploaded_files()
+    if len(files) == 0:
+        return [html.Li("No files yet!")]
+    else:
+        return [{"label": filename, "value": filename} for filename in files]
+
+
+@app.callback(
+    Output("memory-dataframe", "data"), [Input("file-list", "value")],
+)
+def return_selected_file(value):
+    return value
+
+
+@app.callback(
+    [
+        Output("conversion-status", "children"),
+        Output("conversion-interval", "disabled"),
+    ],
+    [Input("memory-dataframe", "data"), Input("conversion-interval", "n_intervals")],
+)
+def update_conversion_status(dataframe, n_intervals):
+    """Show whether the selected file is served from its columnar copy."""
+    if dataframe is None:
+        return "", True
+    message, pending = conversion_status(dataframe)
+    path = os.path.join(UPLOAD_DIRECTORY, dataframe)
+    schema = None
+    if os.path.exists(path):
+        schema = load_schema(dataframe, file_version(path))
+    if schema is not None:
+        message += " Memory: {:.1f} MB as parsed, {:.1f} MB with compact dtypes.".format(
+            schema["memory_before"] / 1024 ** 2, schema["memory_after"] / 1024 ** 2
+        )
+    return message, not pending
+
+
+@app.callback(
+    [Output("table", "columns"), Output("table", "data"), Output("div-table", "style")],
+    [
+        Input("memory-dataframe", "data"),
+        Input("table", "page_current"),
+        Input("table", "page_size"),
+    ],
+)
+def Create_Dataframe(value, page_current, page_size):
+    """Crate a Pandas Dataframe from chosen File."""
+    if value is None:
+        selected_dataframe = pd.DataFrame()
+        data = selected_dataframe.to_dict("records")
+        columns = [{"name": i, "id": i} for i in selected_dataframe.columns]
+        style = {"display": "none"}
+        return columns, data, style
+
+    path = os.path.join(UPLOAD_DIRECTORY, value)
+    extension = os.path.splitext(path)[1]
+    if extension in SUPPORTED_EXTENSIONS:
+        selected_dataframe = read_page(value, page_current, page_size)
+        data = selected_dataframe.to_dict("records")
+        columns = [{"name": i, "id": i} for i in selected_dataframe.columns]
+        style = {"display": "block"}
+    else:
+        selected_dataframe = pd.DataFrame()
+        data = selected_dataframe.to_dict("records")
+        columns = [{"name": i, "id": i} for i in selected_dataframe.columns]
+        style = {"display": "none"}
+
+    return columns, data, style
+
+
+@app.callback(
+    [Output("customize_control", "children"), Output("filter_box", "children"),],
+    [Input("memory-dataframe", "data")],
+)
+def Create_Dataframe(dataframe):
+    options = [
+        {"label": "Dropdown", "value": "Dropdown"},
+        {"label": "RangeSlider", "value": "RangeSlider"},
+        {"label": "DatePickerRange", "value": "DatePickerRange"},
+    ]
+    if dataframe is None:
+        selected_dataframe = pd.DataFrame()
+        dropdowns = [x for x in selected_dataframe.columns]
+        filter_types = [x for x in selected_dataframe.columns]
+        return dropdowns, filter_types
+    columns = list(load_profile(dataframe)["columns"])
+
+    dropdowns = [
+        html.Div(
+            [
+                html.Div(
+                    [
+                        html.P(
+                            id={"type": "dynamic-dropdown-name", "index": x},
+                            children=x,
+                            className="control_label six columns",
+                        ),
+                        dcc.Dropdown(
+                            id={"type": "dynamic-dropdown", "index": x},
+                            options=options,
+                            className="dcc_control six columns",
+                        ),
+                    ],
+                    className="pretty_container twelve columns",
+                )
+            ],
+            className="row flex-display six columns center",
+        )
+        for x in columns
+    ]
+    filter_types = [
+        html.Div(id={"type": "dynamic-filter", "index": x},)
+        for x in columns
+    ]
+    return dropdowns, filter_types
+
+
+@app.callback(
+    Output({"type": "dynamic-filter", "index": MATCH}, "children"),
+    [Input("memory-dataframe", "data"), Input("goto_main", "n_clicks")],
+    [
+        State({"type": "dynamic-dropdown", "index": MATCH}, "value"),
+        State({"type": "dynamic-dropdown-name", "index": MATCH}, "children"),
+    ],
+)
+def Create_Dataframe(dataframe, submit_coloumn, value, name):
+    if dataframe is None:
+        return ""
+    selected_column = load_profile(dataframe)["columns"][name]
+
+    if value == "Dropdown":
+        column_vlaues = selected_column["values"]
+        columns_values_dict = [{"label": v, "value": v} for v in column_vlaues]
+        return [
+            html.P(children=name, className="control_label",),
+            dcc.Dropdown(
+                id={"type": "selected-filter", "index": name},
+                className="dcc_control",
+                options=columns_values_dict,
+                multi=True,
+            ),
+            html.P(id={"type": "range_slider", "index": name},),
+        ]
+    if value == "RangeSlider":
+        selected_column_min = selected_column["min"]
+        selected_column_max = selected_column["max"]
+
+        return [
+            html.P(children=name, className="control_label",),
+            dcc.RangeSlider(
+                id={"type": "selected-filter", "index": name},
+                className="dcc_control",
+                min=selected_column_min,
+                max=selected_column_max,
+            ),
+            html.P(id={"type": "range_slider", "index": name},),
+        ]
+    if value == "DatePickerRange":
+        min_date_allowed = max_date_allowed = None
+        if selected_column["is_date"]:
+            date_min = pd.Timestamp(selected_column["date_min"])
+            date_max = pd.Timestamp(selected_column["date_max"])
+            min_date_allowed = dt(date_min.year, date_min.month, date_min.day)
+            max_date_allowed = dt(date_max.year, date_max.month, date_max.day)
+        return [
+            html.P(children=name, className="control_label",),
+            dcc.DatePickerRange(
+                id={"type": "selected-filter", "index": name},
+                min_date_allowed=min_date_allowed,
+                max_date_allowed=max_date_allowed,
+                className="dcc_control",
+            ),
+            html.P(id={"type": "range_slider", "index": name},),
+        ]
+    else:
+        return value
+
+
+@app.callback(
+    Output("session-id", "data"),
+    [Input("session-id", "modified_timestamp")],
+    [State("session-id", "data")],
+)
+def assign_session(modified_timestamp, session):
+    if session is not None:
+        raise PreventUpdate
+    return uuid.uuid4().hex
+
+
+@app.callback(
+    Output("table-job", "data"),
+    [
+        Input("memory-dataframe", "data"),
+        Input("select_chart_type", "value"),
+        Input("table_test", "page_current"),
         Input("table_test", "page_size"),
         Input({"type": "selected-filter", "index": ALL}, "id"),
         Input({"type": "selected-filter", "index": ALL}, "value"),
         Input({"type": "selected-filter", "index": ALL}, "start_date"),
         Input({"type": "selected-filter", "index": ALL}, "end_date"),
     ],
+    [State("session-id", "data")],
 )
 def update_figure(
-    dataframe, chart_type, page_current, page_size, column, value, start_date, end_date
+    dataframe,
+    chart_type,
+    page_current,
+    page_size,
+    column,
+    value,
+    start_date,
+    end_date,
+    session,
+):
+    return submit_job(
+        session,
+        "table",
+        build_table,
+        dataframe,
+        page_current,
+        page_size,
+        column,
+        value,
+        start_date,
+        end_date,
+    )
+
+
+def build_table(
+    job, dataframe, page_current, page_size, column, value, start_date, end_date
 ):
     if dataframe is None:
         return "", "", "", "", "", "", "", "", ""
-    path = os.path.join(UPLOAD_DIRECTORY, dataframe)
-    extension = os.path.splitext(path)[1]
-    if extension == ".csv":
-        selected_dataframe = pd.read_csv(path)
-    elif extension == ".feather":
-        selected_dataframe = pd.read_feather(path)
-    for x in range(len(column)):
-        if (value[x] is None) and (start_date[x] is None or end_date[x] is None):
-            continue
-        if isinstance(value[x], list):
-            if len(value[x]) > 0:
-                if isinstance(value[x][0], int) and len(value[x]) == 2:
-                    range_slider = value[x]
-                    selected_dataframe = selected_dataframe[
-                        (selected_dataframe[column[x]["index"]] >= value[x][0])
-                        & (selected_dataframe[column[x]["index"]] <= value[x][1])
-                    ]
-                else:
-                    selected_dataframe = selected_dataframe[
-                        selected_dataframe[column[x]["index"]].isin(value[x])
-                    ]
-                continue
-            else:
-                continue
-        if start_date[x] is not None or end_date[x] is not None:
-            if start_date[x] is not None:
-                selected_dataframe = selected_dataframe[
-                    (selected_dataframe[column[x]["index"]] >= start_date[x])
-                ]
-            if end_date[x] is not None:
-                selected_dataframe = selected_dataframe[
-                    (selected_dataframe[column[x]["index"]] <= end_date[x])
-                ]
-            continue
-        if not isinstance(value[x], list):
-            if value[x] == "":
-                continue
-            selected_dataframe = selected_dataframe[
-                selected_dataframe[column[x]["index"]] == value[x]
-            ]
-    data = selected_dataframe.iloc[
-        page_current * page_size : (page_current + 1) * page_size
-    ].to_dict("records")
-    columns = [{"name": i, "id": i} for i in selected_dataframe.columns]
-    axis_valus = [{"label": v, "value": v} for v in selected_dataframe.columns]
-    group_by_values = []
-    for v in selected_dataframe.columns:
-        if len(selected_dataframe[v].unique()) < selected_dataframe.shape[0] / 2:
-            group_by_values.append({"label": v, "value": v})
+    view = result_view(
+        "table",
+        dataframe,
+        [page_current, page_size, column, value, start_date, end_date],
+    )
+    result = load_result(view)
+    if result is not None:
+        return result
+    report_progress(job, "Filtering...")
+    plan = compile_filters(column, value, start_date, end_date)
+    if not plan:
+        # The unfiltered file is described by its profile, no need to load it.
+        profile = load_profile(dataframe)
+        report_progress(job, "Reading page...")
+        data = read_page(dataframe, page_current, page_size).to_dict("records")
+        names = list(profile["columns"])
+        rows = profile["rows"]
+        group_by_values = [
+            {"label": v, "value": v}
+            for v, column_profile in profile["columns"].items()
+            if column_profile["distinct"] + (column_profile["nulls"] > 0) < rows / 2
+        ]
+    else:
+        page, rows = EXECUTION_BACKENDS[execution_backend(dataframe)]["page"](
+            dataframe, plan, page_current * page_size, page_size
+        )
+        data = page.to_dict("records")
+        names = list(load_profile(dataframe)["columns"])
+        report_progress(job, "Finding columns to group by...", rows)
+        group_by_values = [
+            {"label": v, "value": v}
+            for v in group_by_columns_of(dataframe, rows, plan)
+        ]
+    columns = [{"name": i, "id": i} for i in names]
+    axis_valus = [{"label": v, "value": v} for v in names]
+    report_progress(job, "Serialising...", len(data))
 
-    return (
-        str(column)
-        + "__"
-        + str(value)
-        + str(selected_dataframe.shape[0])
-        + str(start_date)
-        + str(end_date),
-        columns,
-        data,
-        axis_valus,
-        axis_valus,
-        group_by_values,
-        group_by_values,
-        group_by_values,
-        group_by_values,
+    return store_result(
+        view,
+        (
+            str(column)
+            + "__"
+            + str(value)
+            + str(rows)
+            + str(start_date)
+            + str(end_date),
+            columns,
+            data,
+            axis_valus,
+            axis_valus,
+            group_by_values,
+            group_by_values,
+            group_by_values,
+            group_by_values,
+        ),
     )
 
 
 @app.callback(
     [
-        Output("main_graph", "figure"),
-        Output("save_button_container", "style"),
-        Output("alert_save_plot", "children"),
-        Output("n_clicks_save", "children"),
+        Output("test_div", "children"),
+        Output("table_test", "columns"),
+        Output("table_test", "data"),
+        Output("select_x_axis", "options"),
+        Output("select_y_axis", "options"),
+        Output("group_by_columns", "options"),
+        Output("color_columns", "options"),
+        Output("facet_row", "options"),
+        Output("facet_col", "options"),
+        Output("table-progress", "children"),
+        Output("table-job-interval", "disabled"),
     ],
+    [Input("table-job", "data"), Input("table-job-interval", "n_intervals")],
+)
+def poll_table(job_id, n_intervals):
+    if job_id is None:
+        raise PreventUpdate
+    return job_outputs(job_id, 9)
+
+
+@app.callback(
+    Output("figure-job", "data"),
     [
         Input("memory-dataframe", "data"),
         Input("save_button", "n_clicks"),
         Input("show_figure", "n_clicks"),
+        Input("main_graph", "relayoutData"),
     ],
     [
         State("n_clicks_save", "children"),
@@ -664,12 +3736,72 @@ def update_figure(
         State("color_columns", "value"),
         State("facet_row", "value"),
         State("facet_col", "value"),
+        State("rasterise", "value"),
+        State("save_format", "value"),
+        State("session-id", "data"),
     ],
 )
 def update_figure(
     dataframe,
     n_clicks,
     show_figure,
+    relayout,
+    n_clicks_save,
+    column,
+    value,
+    start_date,
+    end_date,
+    chart_type,
+    x_axis,
+    y_axis,
+    group_by_columns,
+    group_by_function,
+    color_columns,
+    facet_row,
+    facet_col,
+    raster_mode,
+    save_format,
+    session,
+):
+    raster = "rasterise" in (raster_mode or []) and chart_type in RASTER_CHART_TYPES
+    x_range = y_range = None
+    triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+    if "main_graph.relayoutData" in triggered:
+        # Zooming only needs a new figure when the visible grid is rendered here.
+        x_range = relayout_range(relayout or {}, "xaxis")
+        y_range = relayout_range(relayout or {}, "yaxis")
+        if not raster or (x_range is None and y_range is None):
+            raise PreventUpdate
+    return submit_job(
+        session,
+        "figure",
+        build_figure,
+        dataframe,
+        n_clicks,
+        n_clicks_save,
+        column,
+        value,
+        start_date,
+        end_date,
+        chart_type,
+        x_axis,
+        y_axis,
+        group_by_columns,
+        group_by_function,
+        color_columns,
+        facet_row,
+        facet_col,
+        raster,
+        x_range,
+        y_range,
+        save_format,
+    )
+
+
+def build_figure(
+    job,
+    dataframe,
+    n_clicks,
     n_clicks_save,
     column,
     value,
@@ -683,51 +3815,45 @@ def update_figure(
     color_columns,
     facet_row,
     facet_col,
+    raster,
+    x_range,
+    y_range,
+    save_format,
 ):
 
     style = {"display": "none"}
     if dataframe is None or x_axis is None or (y_axis is None) or chart_type is None:
         return go.Figure(), style, "", n_clicks
-    path = os.path.join(UPLOAD_DIRECTORY, dataframe)
-    extension = os.path.splitext(path)[1]
-    if extension == ".csv":
-        selected_dataframe = pd.read_csv(path)
-    elif extension == ".feather":
-        selected_dataframe = pd.read_feather(path)
-    for x in range(len(column)):
-        if (value[x] is None) and (start_date[x] is None or end_date[x] is None):
-            continue
-        if isinstance(value[x], list):
-            if len(value[x]) > 0:
-                if isinstance(value[x][0], int) and len(value[x]) == 2:
-                    range_slider = value[x]
-                    selected_dataframe = selected_dataframe[
-                        (selected_dataframe[column[x]["index"]] >= value[x][0])
-                        & (selected_dataframe[column[x]["index"]] <= value[x][1])
-                    ]
-                else:
-                    selected_dataframe = selected_dataframe[
-                        selected_dataframe[column[x]["index"]].isin(value[x])
-                    ]
-                continue
-            else:
-                continue
-        if start_date[x] is not None or end_date[x] is not None:
-            if start_date[x] is not None:
-                selected_dataframe = selected_dataframe[
-                    (selected_dataframe[column[x]["index"]] >= start_date[x])
-                ]
-            if end_date[x] is not None:
-                selected_dataframe = selected_dataframe[
-                    (selected_dataframe[column[x]["index"]] <= end_date[x])
-                ]
-            continue
-        if not isinstance(value[x], list):
-            if value[x] == "":
-                continue
-            selected_dataframe = selected_dataframe[
-                selected_dataframe[column[x]["index"]] == value[x]
-            ]
+    # Saving a plot needs its figure, so saves are never served from the cache.
+    save = n_clicks > n_clicks_save
+    view = result_view(
+        "figure",
+        dataframe,
+        [
+            column,
+            value,
+            start_date,
+            end_date,
+            chart_type,
+            x_axis,
+            y_axis,
+            group_by_columns,
+            group_by_function,
+            color_columns,
+            facet_row,
+            facet_col,
+            raster,
+            x_range,
+            y_range,
+        ],
+    )
+    figure = None if save else load_result(view)
+    if figure is not None:
+        return figure, {"display": "block"}, "", n_clicks
+    columns = plot_columns(
+        x_axis, y_axis, color_columns, facet_row, facet_col, group_by_columns, column,
+    )
+    plan = compile_filters(column, value, start_date, end_date)
     if (
         group_by_columns != []
         and group_by_columns is not None
@@ -741,14 +3867,41 @@ def update_figure(
         and group_by_function != []
         and group_by_function is not None
     ):
-        selected_dataframe = (
-            selected_dataframe.groupby(group_by_columns)
-            .agg(group_by_function)
-            .reset_index()
-            .sort_values(by=y_axis)
+        report_progress(job, "Aggregating...")
+        selected_dataframe = aggregate(
+            dataframe,
+            plan,
+            group_by_columns,
+            group_by_function,
+            plot_columns(y_axis, color_columns, facet_row, facet_col),
+        ).sort_values(by=y_axis)
+    else:
+        report_progress(job, "Loading data...")
+        selected_dataframe = EXECUTION_BACKENDS[execution_backend(dataframe)]["scan"](
+            dataframe, columns, plan
+        )
+    rows = len(selected_dataframe)
+    report_progress(job, "Downsampling...", rows)
+    raster = (
+        raster
+        and is_continuous(selected_dataframe[x_axis])
+        and is_continuous(selected_dataframe[y_axis])
+    )
+    if not raster:
+        selected_dataframe = downsample(
+            selected_dataframe,
+            chart_type,
+            x_axis,
+            y_axis,
+            [color_columns, facet_row, facet_col] + list(group_by_columns or []),
         )
 
-    if color_columns != [] and color_columns is not None:
+    report_progress(job, "Building figure...", len(selected_dataframe))
+    if raster:
+        fig = rasterise(
+            selected_dataframe, chart_type, x_axis, y_axis, x_range, y_range
+        )
+    elif color_columns != [] and color_columns is not None:
         if group_by_columns is None or group_by_columns == []:
             fig = getattr(px, chart_type)(
                 selected_dataframe,
@@ -812,9 +3965,25 @@ def update_figure(
     if facet_row != None and facet_row != []:
         height = 800
     fig.update_layout(margin=dict(l=20, r=20, t=20, b=20), height=height)
+    if len(selected_dataframe) < rows:
+        fig.add_annotation(
+            text="Downsampled: showing {:,} of {:,} points".format(
+                len(selected_dataframe), rows
+            ),
+            xref="paper",
+            yref="paper",
+            x=1,
+            y=1,
+            xanchor="right",
+            yanchor="top",
+            showarrow=False,
+            bgcolor="rgba(255, 255, 255, 0.8)",
+        )
+    report_progress(job, "Serialising...")
     style = {"display": "block"}
-    alert = ""
-    if n_clicks > n_clicks_save:
+    saved_path = ""
+    if save:
+        report_progress(job, "Saving plot...")
         now = datetime.now()
 
         current_time = (
@@ -828,13 +3997,43 @@ def update_figure(
             + " func- "
             + str(group_by_function)
         )
-        fig.write_html("data/plots/" + str(current_time) + ".html")
+        saved_path = save_plot(fig, str(current_time), save_format or "html")
         style = {"display": "none"}
-        alert = "Plot is saved in data/plots/" + current_time + ".html seccessfully!"
 
-    return fig, style, alert, n_clicks
+    return store_result(view, encode_figure(fig)), style, saved_path, n_clicks
+
+
+@app.callback(
+    [
+        Output("main_graph", "figure"),
+        Output("save_button_container", "style"),
+        Output("export-path", "data"),
+        Output("n_clicks_save", "children"),
+        Output("figure-progress", "children"),
+        Output("figure-job-interval", "disabled"),
+    ],
+    [Input("figure-job", "data"), Input("figure-job-interval", "n_intervals")],
+)
+def poll_figure(job_id, n_intervals):
+    if job_id is None:
+        raise PreventUpdate
+    return job_outputs(job_id, 4)
+
+
+@app.callback(
+    [Output("alert_save_plot", "children"), Output("export-interval", "disabled")],
+    [Input("export-path", "data"), Input("export-interval", "n_intervals")],
+)
+def poll_export(path, n_intervals):
+    """Show whether the last saved plot has been written, or why it failed."""
+    if not path:
+        return "", True
+    message, pending = export_status(path)
+    return message, not pending
+
 
+if WARM_RESULTS:
+    conversion_executor.submit(warm_result_cache, WARM_RESULTS)
 
 if __name__ == "__main__":
     app.run_server()
-pr
\ No newline at end of file